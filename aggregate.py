@@ -0,0 +1,81 @@
+import os
+import json
+import numpy as np
+from cache import SQLiteCache, make_key
+
+# aggregation of the results for visualize.py: means and bootstrap confidence intervals of the metrics of all
+# conditions, computed in one vectorized resampling pass and cached by a hash of the results and the settings
+
+# location of the cache of aggregates (set to None to disable caching)
+cache_path = os.path.join("cache", "aggregates.sqlite")
+# version of the aggregation (part of the key, increase it when the computation changes)
+AGGREGATES_VERSION = "1"
+
+# arrange the results as an array of shape (conditions, poems, metrics), padded with zeros for conditions with fewer
+# poems, and the number of poems of each condition
+# (data: dictionary from tag to a list of tuples of metric values, one per poem)
+def get_values(data, tags):
+    counts = np.array([len(data[tag]) for tag in tags], dtype=np.int64)
+    # the number of metrics from the first condition with results
+    metrics = next((len(data[tag][0]) for tag in tags if len(data[tag]) > 0), 0)
+    values = np.zeros((len(tags), max(counts.max(initial=0), 1), metrics))
+    for c in range(len(tags)):
+        if counts[c] > 0:
+            values[c, :counts[c]] = np.array(data[tags[c]], dtype=float)
+    return values, counts
+
+# get the bootstrap distributions of the means, of shape (conditions, resamples, metrics)
+# all conditions and metrics share the same resamples: one matrix of uniform random numbers (resamples x poems, with
+# a fixed seed), from which the indices of the poems are derived for the number of poems of each condition; each
+# resample is represented by the number of times each poem is drawn, so that the means of all conditions and metrics
+# are a single (batched) matrix product. The resamples are processed in batches of batch_size to limit memory
+def bootstrap_means(values, counts, n_resamples=9999, seed=0, batch_size=1000):
+    conditions, poems, metrics = values.shape
+    uniform = np.random.default_rng(seed).random((n_resamples, poems))
+    means = np.empty((conditions, n_resamples, metrics))
+    for start in range(0, n_resamples, batch_size):
+        end = min(start + batch_size, n_resamples)
+        batch = end - start
+        # indices of the drawn poems (conditions x resamples x draws), only the first counts[c] draws are used
+        indices = np.minimum((uniform[None, start:end, :] * counts[:, None, None]).astype(np.int64),
+                             np.maximum(counts[:, None, None] - 1, 0))
+        used = np.arange(poems)[None, None, :] < counts[:, None, None]
+        cells = (np.arange(conditions)[:, None, None] * batch + np.arange(batch)[None, :, None]) * poems + indices
+        weights = np.bincount(cells[np.broadcast_to(used, cells.shape)], minlength=conditions * batch * poems)
+        weights = weights.reshape(conditions, batch, poems).astype(float)
+        means[:, start:end] = np.matmul(weights, values) / np.maximum(counts, 1)[:, None, None]
+    return means
+
+# get the mean, the mean of the bootstrap distribution and the "basic" bootstrap confidence interval (as computed by
+# scipy.stats.bootstrap with method="basic") of each metric of each condition
+# returns a dictionary from tag to {"mean": […], "bootstrap_mean": […], "low": […], "high": […]} (one value per metric)
+def compute_aggregates(data, tags, n_resamples=9999, confidence_level=0.95, seed=0):
+    values, counts = get_values(data, tags)
+    means = values.sum(axis=1) / np.maximum(counts, 1)[:, None]
+    distributions = bootstrap_means(values, counts, n_resamples=n_resamples, seed=seed)
+    alpha = (1 - confidence_level) / 2
+    quantiles = np.quantile(distributions, [alpha, 1 - alpha], axis=1)
+    aggregates = {}
+    for c in range(len(tags)):
+        aggregates[tags[c]] = {"mean": means[c].tolist(), "bootstrap_mean": distributions[c].mean(axis=0).tolist(),
+                               "low": (2 * means[c] - quantiles[1, c]).tolist(),
+                               "high": (2 * means[c] - quantiles[0, c]).tolist()}
+    return aggregates
+
+# get the aggregates (see compute_aggregates), from the cache if the same results have been aggregated with the same
+# settings before (the key is a hash of the results of the given conditions and the settings)
+def get_aggregates(data, tags, n_resamples=9999, confidence_level=0.95, seed=0):
+    if cache_path is None:
+        return compute_aggregates(data, tags, n_resamples=n_resamples, confidence_level=confidence_level, seed=seed)
+    key = make_key(AGGREGATES_VERSION, json.dumps([[tag, data[tag]] for tag in tags]), n_resamples, confidence_level,
+                   seed)
+    cache = SQLiteCache(cache_path, table="aggregates")
+    found = cache.get([key])
+    if key in found:
+        aggregates = json.loads(found[key])
+    else:
+        aggregates = compute_aggregates(data, tags, n_resamples=n_resamples, confidence_level=confidence_level,
+                                        seed=seed)
+        cache.put({key: json.dumps(aggregates)})
+    cache.close()
+    return aggregates
@@ -0,0 +1,609 @@
+import os
+import csv
+import json
+import time
+import argparse
+from decimal import Decimal
+from numpy import ndarray
+from cache import make_key
+from corpus import ORIGINALS, REFERENCE_METRES, REFERENCE_RHYME_SCHEMES
+from corpus import get_condition_tags, parse_metres, parse_rhyme_schemes, read_metres, read_poems, read_rhyme_schemes
+from evaluate_translations import evaluate_form
+from metrics import CometKiwiScorer
+from metrics import edit_distance, edit_distance_alignment, edit_distance_batch, get_metrical_distance, \
+    get_metrical_distance_batch, get_rhyme, get_rhyme_batch, get_rhyme_pairs, get_rhyme_scheme_similarity, \
+    get_stresses, get_stresses_batch
+from phonemes import get_version, phonemize_poems
+
+# benchmarks of the metrics on the sonnet corpus in data/ (the translations of all conditions, the originals and the
+# reference metres and rhyme schemes), each comparing the current code with the original implementation:
+# - stresses: get_stresses for all lines of the translations (German) and the originals (English)
+# - rhymes: get_rhyme (the rhyme and onset) for all lines of the translations and the originals
+# - edit_distance: the edit distance for all lines of a condition against the reference metre (about 11 x 11)
+# - long_lines: the edit distance for long lines (made of consecutive lines of a condition)
+# - metrical_distance: get_metrical_distance for poems with more or fewer lines than the reference metre
+# - rhyme_scheme_similarity: get_rhyme_scheme_similarity for all poems of all conditions
+# - rhyme_pairs: the detection of rhyme pairs for long poems (made of consecutive lines of a condition)
+# - condition: end-to-end scoring of one full condition file (metre and rhyme, and CometKiwi with a tiny local model
+#   instead of the real one), with a check of the results against results.csv (see check_results_csv)
+# - corpus: loading the corpus files (parsing the text files vs. the compiled reference metres and rhyme schemes)
+# every benchmark asserts that the results are identical to those of the original implementation
+# (the benchmarks of a single condition, --condition, read its transcriptions from its golden file and run without
+# espeak; the golden file is written with --write-golden, and tests/ runs the benchmarks with pytest-benchmark)
+# usage: python benchmark.py --only edit_distance rhyme_pairs --report benchmark.json
+
+# the original get_stresses for a transcription (the vowels listed on every call, the transcription scanned by slicing)
+def reference_stresses(transcription, lang="de"):
+    if lang == "de":
+        diphthongs = ["aɪ", "ɔø", "aʊ", "??"]
+        triphthongs = []
+        vowels = ["a", "e", "i", "o", "u", "y", "ø", "ɪ", "ɔ", "ʊ", "ɑ", "ɜ", "ɛ", "ə", "œ"]
+    else:
+        diphthongs = ["aɪ", "oʊ", "aʊ", "eɪ", "iɪ", "ɔɪ", "iə", "n̩", "l̩"]
+        triphthongs = ["aɪɚ", "aʊɚ"]
+        vowels = ["ʌ", "ɛ", "ə", "i", "ɚ", "ɪ", "æ", "u", "ʊ", "ᵻ", "ɐ", "ɑ", "ɜ", "ɔ", "o"]
+    t = transcription
+    sequence = []
+    stress = 0.8
+    while len(t) > 0:
+        if t[0] == "ˈ":
+            stress = 1
+        elif t[0] == "ˌ":
+            stress = 0.9
+        elif len(t) > 2 and t[:3] in triphthongs:
+            sequence.append(stress)
+            stress = 0.8
+            t = t[2:]
+        elif len(t) > 1 and t[:2] in diphthongs:
+            sequence.append(stress)
+            stress = 0.8
+            t = t[1:]
+        elif t[0] in vowels:
+            sequence.append(stress)
+            stress = 0.8
+        t = t[1:]
+    return sequence
+
+# the original get_rhyme for a transcription (one pass over the transcription for each equivalence rule)
+def reference_rhyme(transcription, lang="de"):
+    if lang == "de":
+        equivalences = [("y", "i"), ("ɪ", "i"), ("ɔø", "aɪ"), ("ai", "aɪ"), ("aʊ", "aw"), ("ø", "e"), ("œ", "e"),
+                        ("ɛ", "e"), ("ɑ", "a"), ("ɔ", "o"), ("ʊ", "u"), ("ː", "")]
+        for e in equivalences:
+            transcription = transcription.replace(e[0], e[1])
+        transcription = transcription.replace("ˌ", "ˈ")
+        index = transcription.rfind("ˈ")
+        onset = transcription[index-3:index] if transcription[index-3:index] in ["ʃtɾ", "ʃpɾ", "tsv"] else \
+            transcription[index-2:index] if transcription[index-2:index] in ["ʃl", "ʃm", "ʃn", "ʃɾ", "ʃv", "bɾ",
+                                                                             "bl", "dɾ", "fɾ", "fl", "ɡɾ", "ɡl",
+                                                                             "ɡn", "kl", "kɾ", "kn", "pl", "pɾ",
+                                                                             "pn", "kv", "ʃt", "ʃp", "tɾ", "vɾ",
+                                                                             "ts", "pf", "ps", "ks"] else \
+            transcription[index-1:index]
+    else:
+        transcription = transcription.replace("ˌ", "ˈ")
+        index = transcription.rfind("ˈ")
+        onset = transcription[index-3:index] if transcription[index-3:index] in ["stɹ", "spɹ"] else \
+            transcription[index-2:index] if transcription[index-2:index] in ["pl", "pɹ", "bl", "bɹ", "fl", "fɹ",
+                                                                             "tɹ", "dɹ", "ʃɾ", "sl", "tʃ", "dʒ",
+                                                                             "sw", "kw", "kɹ", "kl", "gl", "gɹ",
+                                                                             "ks"] else \
+            transcription[index-1:index]
+    return transcription[index+1:], onset
+
+# the original implementation of the edit distance (filling a numpy array cell by cell), kept as a baseline
+def reference_edit_distance_alignment(line, metre):
+    l = [0] + line
+    m = [0] + metre
+    value_table = ndarray((len(l), len(m)))
+    pointer_table = ndarray((len(l), len(m)))
+    for i in range(len(l)):
+        value_table[i][0] = sum(l[0:i + 1])
+        pointer_table[i][0] = 2
+    for j in range(len(m)):
+        value_table[0][j] = sum(m[0:j + 1])
+        pointer_table[0][j] = 1
+    for i in range(1, len(l)):
+        for j in range(1, len(m)):
+            insert = value_table[i - 1][j] + l[i]
+            delete = value_table[i][j - 1] + m[j]
+            substitute = value_table[i - 1][j - 1] + abs(l[i] - m[j])
+            value_table[i][j] = min(insert, delete, substitute)
+            if delete < insert and delete < substitute:
+                pointer_table[i][j] = 1
+            elif insert < substitute:
+                pointer_table[i][j] = 2
+            else:
+                pointer_table[i][j] = 0
+    score = value_table[-1][-1]
+    i = len(l) - 1
+    j = len(m) - 1
+    alignment = []
+    while j >= 0 and i >= 0:
+        internal = []
+        while pointer_table[i][j] == 2:
+            internal = [l[i]] + internal
+            i -= 1
+        if pointer_table[i][j] == 0:
+            internal = [l[i]] + internal
+            i -= 1
+            j -= 1
+        elif pointer_table[i][j] == 1:
+            internal = [0] + internal
+            j -= 1
+        alignment = [internal] + alignment
+    return alignment, score
+
+# the original detection of rhyme pairs (comparing all pairs of lines), kept as a baseline
+def reference_rhyme_pairs(rhymes):
+    pairs = []
+    for i in range(len(rhymes)):
+        for j in range(len(rhymes)-i-1):
+            if rhymes[i][0]==rhymes[j+i+1][0] and rhymes[i][1]!=rhymes[j+i+1][1]:
+                pairs.append([i,j+i+1])
+            elif (rhymes[i][0].endswith(rhymes[j+i+1][0]) or rhymes[j+i+1][0].endswith(rhymes[i][0])) and \
+                    rhymes[i][1]!=rhymes[j+i+1][1] and not \
+                    rhymes[i][0].endswith(rhymes[j+i+1][1]+rhymes[j+i+1][0]) and not \
+                    rhymes[j+i+1][1].endswith(rhymes[i][1]+rhymes[i][0]):
+                pairs.append([i,j+i+1])
+    return pairs
+
+# the original metrical distance (with the original edit distance), for a candidate given as stress values
+def reference_metrical_distance(candidate, metrical_pattern):
+    stresses = candidate.copy()
+    metre = metrical_pattern.copy()
+    total = 0
+    if len(stresses) == 0 or len(metre) == 0:
+        return None
+    elif len(stresses) > len(metre):
+        diff = len(stresses) - len(metre)
+        while diff > 0:
+            min_value = 1000
+            min_index = 0
+            for x in range(len(stresses)):
+                value = sum(stresses[x])
+                if value < min_value:
+                    min_value = value
+                    min_index = x
+            total += sum(stresses.pop(min_index))
+            diff -= 1
+    elif len(metre) > len(stresses):
+        diff = len(metre) - len(stresses)
+        while diff > 0:
+            min_value = 1000
+            min_index = 0
+            for x in range(len(metre)):
+                value = sum(metre[x])
+                if value < min_value:
+                    min_value = value
+                    min_index = x
+            total += sum(metre.pop(min_index))
+            diff -= 1
+    return (total + sum([reference_edit_distance_alignment(stresses[i], metre[i])[1]
+                         for i in range(len(stresses))])) / len(metre)
+
+# the original rhyme scheme similarity, for a candidate given as the (rhyme, onset) pairs of its non-empty lines
+def reference_rhyme_scheme_similarity(rhymes, rhyme_scheme):
+    candidate_rhyme_scheme = reference_rhyme_pairs(rhymes)
+    f1_score = 0
+    if len(candidate_rhyme_scheme) > 0:
+        precision = len([e for e in candidate_rhyme_scheme if e in rhyme_scheme]) / len(candidate_rhyme_scheme)
+    else:
+        precision = 1.0
+    if len(rhyme_scheme) > 0:
+        recall = len([e for e in rhyme_scheme if e in candidate_rhyme_scheme]) / len(rhyme_scheme)
+    else:
+        recall = 1.0
+    if precision + recall > 0:
+        f1_score = 2 * precision * recall / (precision + recall)
+    return precision, recall, f1_score
+
+# tiny local stand-in for the CometKiwi model (same predict interface, deterministic scores from the lengths), so
+# that the scorer can be benchmarked without downloading and running the real model
+class TinyCometModel:
+    class Output:
+        def __init__(self, scores):
+            self.scores = scores
+
+    def predict(self, data, batch_size=16, gpus=1, num_workers=None, length_batching=True):
+        return TinyCometModel.Output([get_tiny_comet_score(d["src"], d["mt"]) for d in data])
+
+def get_tiny_comet_score(original, translation):
+    return len(translation) / (len(original) + len(translation) + 1)
+
+# time a function on all pairs of stresses and metres, returning the results and the time in seconds
+def run(function, pairs):
+    start = time.perf_counter()
+    results = [function(line, metre) for line, metre in pairs]
+    return results, time.perf_counter() - start
+
+# time a call of a function, returning its result and the time in seconds
+def measure(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+# the golden file of a condition (golden_dir/<tag>.json): its transcriptions (with the versions of phonemizer and
+# espeak with which they were made), so that its scores can be checked against results.csv without espeak and
+# independently of the installed espeak version. From these transcriptions, the original implementation reproduces
+# the rhyme scheme similarities in results.csv, but not all metrical distances, which were computed with another,
+# unrecorded espeak version (the transcriptions differ in stress): the poems whose metrical distance differs from
+# results.csv are recorded in the golden file, and the others are checked
+golden_dir = os.path.join("tests", "golden")
+
+def get_golden_path(directory, tag):
+    return os.path.join(directory, f"{tag}.json")
+
+# key of the translations of a condition, to check that a golden file belongs to the current condition file
+def get_translations_key(translations):
+    return make_key(*translations)
+
+def load_golden(path):
+    with open(path, "r") as infile:
+        return json.load(infile)
+
+# read the (metrical distance, rhyme scheme similarity) of each poem of a condition from a csv file in the format of
+# results.csv (tag, poem number, cometkiwi, metrical distance, rhyme scheme similarity)
+def read_results_csv(path, tag):
+    values = {}
+    for l in csv.reader(open(path, "r")):
+        if len(l) >= 5 and l[0] == tag:
+            values[int(l[1])] = tuple(None if x == "None" else float(x) for x in l[3:5])
+    return [values[i + 1] for i in range(len(values))]
+
+# round a value as in results.csv (the shortest representation of the value, rounded to 15 significant digits)
+def round_csv_value(value):
+    return None if value is None else float(format(Decimal(repr(value)), ".15g"))
+
+# get the poem numbers whose metrical distance or rhyme scheme similarity (in scores) differs from results.csv
+def get_csv_mismatches(scores, values):
+    return [[i + 1 for i in range(len(scores)) if round_csv_value(scores[i][m]) != values[i][m]] for m in range(2)]
+
+# write the golden file of a condition: its transcriptions, and the poems whose metrical distance computed from them
+# with the original implementation differs from results.csv
+def write_golden(corpus, tag, results_path, directory=golden_dir):
+    transcriptions = phonemize_poems(corpus.translations[tag], lang="de")
+    scores = reference_scores(corpus.translations[tag], transcriptions, corpus.metres, corpus.rhyme_schemes)
+    metre_mismatches, rhyme_mismatches = get_csv_mismatches(scores, read_results_csv(results_path, tag))
+    os.makedirs(directory, exist_ok=True)
+    with open(get_golden_path(directory, tag), "w") as outfile:
+        json.dump({"tag": tag, "transcriptions_version": get_version(),
+                   "translations": get_translations_key(corpus.translations[tag]),
+                   "transcriptions": transcriptions,
+                   "metrical_distance_mismatches": metre_mismatches}, outfile, ensure_ascii=False)
+    return metre_mismatches, rhyme_mismatches
+
+# assert that the scores (metrical distance, rhyme scheme similarity) of the poems of a condition, computed from the
+# transcriptions of its golden file, are those in results.csv: the rhyme scheme similarity of every poem, and the
+# metrical distance of every poem except the mismatches recorded in the golden file (which must still differ)
+def check_results_csv(path, golden, scores):
+    values = read_results_csv(path, golden["tag"])
+    assert len(scores) == len(values), f"{len(values)} poems of {golden['tag']} in {path} instead of {len(scores)}"
+    metre_mismatches, rhyme_mismatches = get_csv_mismatches(scores, values)
+    assert rhyme_mismatches == [], \
+        f"rhyme scheme similarity of {golden['tag']} differs from {path} (poems {rhyme_mismatches[:10]})"
+    known = golden["metrical_distance_mismatches"]
+    assert metre_mismatches == known, \
+        f"metrical distance of {golden['tag']} differs from {path} (poems " \
+        f"{[i for i in metre_mismatches if i not in known][:10]}) or matches it where it is known to differ (poems " \
+        f"{[i for i in known if i not in metre_mismatches][:10]})"
+
+# the original implementation of metre and rhyme, poem by poem (with the given transcriptions, as the original
+# phonemized every line with a separate call); returns (metrical distance, rhyme scheme similarity) of each poem
+def reference_scores(translations, transcriptions, metres, rhyme_schemes):
+    results = []
+    for i in range(len(translations)):
+        lines = translations[i].split("\n")
+        stresses = [reference_stresses(transcriptions[i][j], lang="de") for j in range(len(lines))]
+        rhymes = [reference_rhyme(transcriptions[i][j], lang="de") for j in range(len(lines))
+                  if lines[j].strip() != ""]
+        results.append((reference_metrical_distance([x for x in stresses if x != []], metres[i]),
+                        reference_rhyme_scheme_similarity(rhymes, rhyme_schemes[i])[2]))
+    return results
+
+# the current implementation of metre and rhyme for a whole condition (evaluate_form, with the stresses and rhymes
+# from the given transcriptions); returns (metrical distance, rhyme scheme similarity) of each poem
+def current_scores(tag, translations, transcriptions, metres, rhyme_schemes):
+    features = {tag: TranscriptionFeatures(translations, transcriptions)}
+    units = [(tag, i, translations[i], metres[i], rhyme_schemes[i], "de", "", "") for i in range(len(translations))]
+    values = {(r[1], r[2]): r[5] for r in evaluate_form(units, features=features)}
+    return [(values[(i + 1, "metrical_distance")], values[(i + 1, "rhyme_scheme_similarity")])
+            for i in range(len(translations))]
+
+# the stress values and (rhyme, onset) pairs of the non-empty lines of each poem of a condition, from its
+# transcriptions (with the interface of features.Features, so that evaluate_form can score the condition without
+# phonemizing it)
+class TranscriptionFeatures:
+    def __init__(self, translations, transcriptions, lang="de"):
+        self.stresses = [[x for x in get_stresses_batch(t, lang=lang) if x != []] for t in transcriptions]
+        self.rhymes = []
+        for poem, t in zip(translations, transcriptions):
+            lines = poem.split("\n")
+            self.rhymes.append(get_rhyme_batch([t[j] for j in range(len(lines)) if lines[j].strip() != ""],
+                                               lang=lang))
+
+    def get_stresses(self, i):
+        return self.stresses[i]
+
+    def get_rhymes(self, i):
+        return self.rhymes[i]
+
+# the sonnet corpus: the originals, the reference metres and rhyme schemes, and the translations of all conditions
+# (the transcriptions, and the stress values and (rhyme, onset) pairs derived from them, are only computed when they
+# are needed, and are read from the golden file of a condition (see write_golden) if there is one, so that the
+# benchmarks of the golden condition run without espeak)
+class Corpus:
+    def __init__(self, data_dir="data", golden_dir=golden_dir):
+        self.data_dir = data_dir
+        self.golden_dir = golden_dir
+        self.originals = read_poems(os.path.join(data_dir, ORIGINALS))
+        self.metres = read_metres(os.path.join(data_dir, REFERENCE_METRES)).to_lists()
+        self.rhyme_schemes = read_rhyme_schemes(os.path.join(data_dir, REFERENCE_RHYME_SCHEMES)).to_lists()
+        self.tags = get_condition_tags(data_dir)
+        self.translations = {tag: read_poems(os.path.join(data_dir, tag)) for tag in self.tags}
+        self.transcriptions = {}
+        self.original_transcriptions = None
+        self.features = {}
+
+    # get the transcriptions of the lines of each poem of a condition
+    def get_transcriptions(self, tag):
+        if tag not in self.transcriptions:
+            path = get_golden_path(self.golden_dir, tag)
+            golden = load_golden(path) if os.path.exists(path) else None
+            if golden is not None and golden["translations"] == get_translations_key(self.translations[tag]):
+                self.transcriptions[tag] = golden["transcriptions"]
+            else:
+                self.transcriptions[tag] = phonemize_poems(self.translations[tag], lang="de")
+        return self.transcriptions[tag]
+
+    def get_original_transcriptions(self):
+        if self.original_transcriptions is None:
+            self.original_transcriptions = phonemize_poems(self.originals, lang="en")
+        return self.original_transcriptions
+
+    # get the stress values and (rhyme, onset) pairs of the non-empty lines of each poem of a condition
+    def get_features(self, tag):
+        if tag not in self.features:
+            self.features[tag] = TranscriptionFeatures(self.translations[tag], self.get_transcriptions(tag))
+        return self.features[tag]
+
+    def get_stresses(self, tag):
+        return self.get_features(tag).stresses
+
+    def get_rhymes(self, tag):
+        return self.get_features(tag).rhymes
+
+    # get all pairs of (stresses of a line, reference metre of the corresponding line) in the given conditions
+    def get_pairs(self, tags):
+        pairs = []
+        for tag in tags:
+            poems = self.get_stresses(tag)
+            for i in range(min(len(poems), len(self.metres))):
+                pairs += [(poems[i][j], self.metres[i][j]) for j in range(min(len(poems[i]), len(self.metres[i])))]
+        return pairs
+
+    # get the (rhyme, onset) pairs of all lines in the given conditions
+    def get_all_rhymes(self, tags):
+        return [rhyme for tag in tags for poem in self.get_rhymes(tag) for rhyme in poem]
+
+# pairs of long lines, each made of `length` consecutive lines (and the corresponding metres)
+def get_long_pairs(pairs, length, count=20):
+    return [(sum([line for line, metre in pairs[start:start + length]], []),
+             sum([metre for line, metre in pairs[start:start + length]], []))
+            for start in range(0, length * count, length)]
+
+# long poems of `length` lines, made of consecutive lines (repeating the lines up to `total` lines)
+def get_long_poems(rhymes, length, total=30000):
+    rhymes = (rhymes * (total // len(rhymes) + 1))[:total]
+    return [rhymes[start:start + length] for start in range(0, total - length + 1, length)]
+
+# poems with fewer or more lines than the reference metre (lines removed, or lines of the poem repeated), and their
+# reference metres
+def get_metrical_variants(poems, metres):
+    candidates = []
+    variant_metres = []
+    for i in range(len(metres)):
+        stresses = poems[i]
+        for variant in [stresses[:-1], stresses[:-3], stresses[::2], stresses + stresses[:2]]:
+            candidates.append(variant)
+            variant_metres.append(metres[i])
+    return candidates, variant_metres
+
+# the transcriptions of all lines of the translations (German) and of the originals (English)
+def get_all_transcriptions(corpus):
+    return [("German", "de", [transcription for tag in corpus.tags for poem in corpus.get_transcriptions(tag)
+                              for transcription in poem]),
+            ("English", "en", [transcription for poem in corpus.get_original_transcriptions()
+                               for transcription in poem])]
+
+# each benchmark gets the corpus and the command line arguments and returns a list of measurements
+# (name, time of the original implementation or None, time of the current implementation)
+# (the benchmarks of the stresses, rhymes and rhyme scheme similarity use all conditions and need espeak, the others
+# use the condition given by --condition)
+
+def benchmark_stresses(corpus, args):
+    measurements = []
+    for language, lang, transcriptions in get_all_transcriptions(corpus):
+        reference, reference_time = measure(lambda: [reference_stresses(transcription, lang=lang)
+                                                     for transcription in transcriptions])
+        stresses, stress_time = measure(lambda: [get_stresses(None, lang=lang, transcription=transcription)
+                                                 for transcription in transcriptions])
+        batch_stresses, batch_time = measure(get_stresses_batch, transcriptions, lang=lang)
+        assert stresses == reference
+        assert batch_stresses == reference
+        name = f"{len(transcriptions)} {language} lines"
+        measurements += [(f"get_stresses, {name}", reference_time, stress_time),
+                         (f"get_stresses_batch, {name}", reference_time, batch_time)]
+    return measurements
+
+def benchmark_rhymes(corpus, args):
+    measurements = []
+    for language, lang, transcriptions in get_all_transcriptions(corpus):
+        reference, reference_time = measure(lambda: [reference_rhyme(transcription, lang=lang)
+                                                     for transcription in transcriptions])
+        rhymes, rhyme_time = measure(lambda: [get_rhyme(None, lang=lang, transcription=transcription)
+                                              for transcription in transcriptions])
+        batch_rhymes, batch_time = measure(get_rhyme_batch, transcriptions, lang=lang)
+        assert rhymes == reference
+        assert batch_rhymes == reference
+        name = f"{len(transcriptions)} {language} lines"
+        measurements += [(f"get_rhyme, {name}", reference_time, rhyme_time),
+                         (f"get_rhyme_batch, {name}", reference_time, batch_time)]
+    return measurements
+
+def benchmark_edit_distance(corpus, args):
+    pairs = corpus.get_pairs([args.condition])
+    reference, reference_time = run(reference_edit_distance_alignment, pairs)
+    alignments, alignment_time = run(edit_distance_alignment, pairs)
+    scores, score_time = run(edit_distance, pairs)
+    batch_scores, batch_time = measure(edit_distance_batch, [line for line, metre in pairs],
+                                       [metre for line, metre in pairs])
+    assert alignments == reference
+    assert scores == [r[1] for r in reference]
+    assert batch_scores == scores
+    return [(f"edit_distance_alignment, {len(pairs)} lines", reference_time, alignment_time),
+            (f"edit_distance (score only), {len(pairs)} lines", reference_time, score_time),
+            (f"edit_distance_batch, {len(pairs)} lines", reference_time, batch_time)]
+
+def benchmark_long_lines(corpus, args):
+    pairs = corpus.get_pairs([args.condition])
+    measurements = []
+    for length in [10, 30]:
+        long_pairs = get_long_pairs(pairs, length)
+        reference, reference_time = run(reference_edit_distance_alignment, long_pairs)
+        alignments, alignment_time = run(edit_distance_alignment, long_pairs)
+        scores, score_time = run(edit_distance, long_pairs)
+        batch_scores, batch_time = measure(edit_distance_batch, [line for line, metre in long_pairs],
+                                           [metre for line, metre in long_pairs])
+        assert alignments == reference
+        assert scores == [r[1] for r in reference]
+        assert batch_scores == scores
+        name = f"{len(long_pairs)} lines of {length} lines"
+        measurements += [(f"edit_distance_alignment, {name}", reference_time, alignment_time),
+                         (f"edit_distance (score only), {name}", reference_time, score_time),
+                         (f"edit_distance_batch, {name}", reference_time, batch_time)]
+    return measurements
+
+def benchmark_metrical_distance(corpus, args):
+    candidates, metres = get_metrical_variants(corpus.get_stresses(args.condition), corpus.metres)
+    reference, reference_time = run(reference_metrical_distance, zip(candidates, metres))
+    distances, distance_time = run(get_metrical_distance, zip(candidates, metres))
+    batch_distances, batch_time = measure(get_metrical_distance_batch, candidates, metres)
+    assert distances == reference
+    assert batch_distances == reference
+    name = f"{len(candidates)} poems of {args.condition} with a different number of lines"
+    return [(f"get_metrical_distance, {name}", reference_time, distance_time),
+            (f"get_metrical_distance_batch, {name}", reference_time, batch_time)]
+
+def benchmark_rhyme_scheme_similarity(corpus, args):
+    poems = [(corpus.get_rhymes(tag)[i], corpus.rhyme_schemes[i]) for tag in corpus.tags
+             for i in range(len(corpus.rhyme_schemes))]
+    texts = [(corpus.translations[tag][i], corpus.get_transcriptions(tag)[i], corpus.rhyme_schemes[i])
+             for tag in corpus.tags for i in range(len(corpus.rhyme_schemes))]
+    # from the (rhyme, onset) pairs of the lines
+    reference, reference_time = run(reference_rhyme_scheme_similarity, poems)
+    similarities, similarity_time = run(get_rhyme_scheme_similarity, poems)
+    # from the texts (and their transcriptions)
+    def reference_text_similarities():
+        similarities = []
+        for text, transcriptions, rhyme_scheme in texts:
+            lines = text.split("\n")
+            rhymes = [reference_rhyme(transcriptions[j], lang="de") for j in range(len(lines))
+                      if lines[j].strip() != ""]
+            similarities.append(reference_rhyme_scheme_similarity(rhymes, rhyme_scheme))
+        return similarities
+    reference_texts, reference_text_time = measure(reference_text_similarities)
+    text_similarities, text_time = measure(lambda: [get_rhyme_scheme_similarity(text, rhyme_scheme, lang="de",
+                                                                                transcriptions=transcriptions)
+                                                    for text, transcriptions, rhyme_scheme in texts])
+    assert similarities == reference
+    assert reference_texts == reference
+    assert text_similarities == reference
+    return [(f"get_rhyme_scheme_similarity, {len(poems)} poems (from rhymes)", reference_time, similarity_time),
+            (f"get_rhyme_scheme_similarity, {len(poems)} poems (from texts)", reference_text_time, text_time)]
+
+def benchmark_rhyme_pairs(corpus, args):
+    rhymes = corpus.get_all_rhymes([args.condition])
+    measurements = []
+    for length in [14, 140, 1000, 3000]:
+        poems = get_long_poems(rhymes, length)
+        reference, reference_time = run(lambda poem, _: reference_rhyme_pairs(poem), [(p, None) for p in poems])
+        indexed, indexed_time = run(lambda poem, _: get_rhyme_pairs(poem), [(p, None) for p in poems])
+        assert indexed == reference
+        measurements.append((f"get_rhyme_pairs, {len(poems)} poems of {length} lines", reference_time, indexed_time))
+    return measurements
+
+def benchmark_condition(corpus, args):
+    tag = args.condition
+    translations = corpus.translations[tag]
+    transcriptions = corpus.get_transcriptions(tag)
+    reference, reference_time = measure(reference_scores, translations, transcriptions, corpus.metres,
+                                        corpus.rhyme_schemes)
+    scores, score_time = measure(current_scores, tag, translations, transcriptions, corpus.metres,
+                                 corpus.rhyme_schemes)
+    assert scores == reference
+    check_results_csv(args.results, load_golden(get_golden_path(corpus.golden_dir, tag)), scores)
+
+    # CometKiwi with the tiny local model (without the cache), to measure the overhead of the scorer
+    scorer = CometKiwiScorer(cache_path=None)
+    scorer.model = TinyCometModel()
+    comet_scores, comet_time = measure(scorer.score, corpus.originals, translations)
+    assert comet_scores == [get_tiny_comet_score(corpus.originals[i], translations[i])
+                            for i in range(len(translations))]
+    return [(f"metre and rhyme of {tag}, {len(translations)} poems", reference_time, score_time),
+            (f"CometKiwi scorer with a tiny model, {len(translations)} poems", None, comet_time)]
+
+def benchmark_corpus(corpus, args):
+    measurements = []
+    metre_path = os.path.join(corpus.data_dir, REFERENCE_METRES)
+    rhyme_path = os.path.join(corpus.data_dir, REFERENCE_RHYME_SCHEMES)
+    for name, parse, read, path in [("metres", parse_metres, read_metres, metre_path),
+                                    ("rhyme schemes", parse_rhyme_schemes, read_rhyme_schemes, rhyme_path)]:
+        read(path) # compile the file (if it has not been compiled yet)
+        parsed, parse_time = measure(parse, path)
+        compiled, load_time = measure(read, path)
+        assert compiled.to_lists() == parsed
+        measurements.append((f"reading the reference {name}", parse_time, load_time))
+    return measurements
+
+BENCHMARKS = {"stresses": benchmark_stresses, "rhymes": benchmark_rhymes, "edit_distance": benchmark_edit_distance,
+              "long_lines": benchmark_long_lines, "metrical_distance": benchmark_metrical_distance,
+              "rhyme_scheme_similarity": benchmark_rhyme_scheme_similarity, "rhyme_pairs": benchmark_rhyme_pairs,
+              "condition": benchmark_condition, "corpus": benchmark_corpus}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the metrics on the sonnet corpus.")
+    parser.add_argument("--data", default="data", help="directory with the originals, references and translations")
+    parser.add_argument("--only", nargs="*", default=None, choices=list(BENCHMARKS),
+                        help="benchmarks to run (default: all)")
+    parser.add_argument("--condition", default="gpt4o_plain",
+                        help="condition for the benchmarks of single conditions (with a golden file)")
+    parser.add_argument("--results", default="results.csv",
+                        help="csv file with the results to check the end-to-end benchmark against")
+    parser.add_argument("--golden-dir", default=golden_dir, help="directory with the golden files")
+    parser.add_argument("--write-golden", action="store_true",
+                        help="phonemize the condition and write its golden file (instead of running the benchmarks)")
+    parser.add_argument("--report", default=None, help="JSON file to write the measurements to")
+    args = parser.parse_args()
+
+    corpus = Corpus(args.data, golden_dir=args.golden_dir)
+    if args.write_golden:
+        metre_mismatches, rhyme_mismatches = write_golden(corpus, args.condition, args.results,
+                                                          directory=args.golden_dir)
+        print(f"wrote {get_golden_path(args.golden_dir, args.condition)} ({get_version()}): metrical distance differs "
+              f"from {args.results} for {len(metre_mismatches)} poems, rhyme scheme similarity for "
+              f"{len(rhyme_mismatches)} poems")
+    else:
+        report = []
+        for name in args.only if args.only is not None else BENCHMARKS:
+            for measurement, reference_time, current_time in BENCHMARKS[name](corpus, args):
+                if reference_time is None:
+                    print(f"{measurement}: {current_time:.3f}s")
+                else:
+                    print(f"{measurement}: original {reference_time:.3f}s, current {current_time:.3f}s "
+                          f"({reference_time / current_time:.1f}x)")
+                report.append({"benchmark": name, "measurement": measurement, "original_seconds": reference_time,
+                               "seconds": current_time})
+        if args.report is not None:
+            with open(args.report, "w") as outfile:
+                json.dump(report, outfile, indent=2)
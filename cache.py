@@ -0,0 +1,94 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+# hash the parts of a key (e.g. line, language and version) into a single content-addressed key
+def make_key(*parts):
+    return hashlib.sha256("\0".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+# on-disk key-value cache in an SQLite database, with hit/miss counters and size-bounded eviction
+# (when there are more than max_entries entries, the least recently used ones are removed; None for no limit)
+# can be shared by several threads of a process
+class SQLiteCache:
+    def __init__(self, path, table="cache", max_entries=1000000):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.pid = None
+        self.connection = None
+        self.lock = threading.RLock()
+
+    # open the database (again if the process has been forked since it was last opened)
+    def connect(self):
+        if self.connection is None or self.pid != os.getpid():
+            if os.path.dirname(self.path) != "":
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.migrate()
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS {self.table} "
+                                    f"(key TEXT PRIMARY KEY, value NOT NULL, used REAL NOT NULL)")
+            self.connection.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_used ON {self.table} (used)")
+            self.connection.commit()
+            self.pid = os.getpid()
+        return self.connection
+
+    # bring a table created by an older version of the cache to the current schema: a table with a differently named
+    # value column (e.g. the transcription column of the first transcription cache) keeps its entries with the column
+    # renamed, any other table without a value column is dropped and created again
+    def migrate(self):
+        columns = [row[1] for row in self.connection.execute(f"PRAGMA table_info({self.table})").fetchall()]
+        if len(columns) == 0 or "value" in columns:
+            return
+        others = [column for column in columns if column not in ["key", "used"]]
+        if "key" in columns and "used" in columns and len(others) == 1:
+            self.connection.execute(f"ALTER TABLE {self.table} RENAME COLUMN {others[0]} TO value")
+        else:
+            self.connection.execute(f"DROP TABLE {self.table}")
+        self.connection.commit()
+
+    # look up a list of keys; returns a dictionary with the values of all keys found in the cache
+    def get(self, keys):
+        with self.lock:
+            connection = self.connect()
+            unique_keys = list(set(keys))
+            found = {}
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                rows = connection.execute(f"SELECT key, value FROM {self.table} WHERE key IN "
+                                          f"({','.join('?' * len(chunk))})", chunk).fetchall()
+                for key, value in rows:
+                    found[key] = value
+            if len(found) > 0:
+                now = time.time()
+                connection.executemany(f"UPDATE {self.table} SET used = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+                connection.commit()
+            hits = len([key for key in keys if key in found])
+            self.hits += hits
+            self.misses += len(keys) - hits
+            return found
+
+    # store values (given as a dictionary from key to value) and evict old entries if necessary
+    def put(self, values):
+        with self.lock:
+            connection = self.connect()
+            now = time.time()
+            connection.executemany(f"INSERT OR REPLACE INTO {self.table} (key, value, used) VALUES (?, ?, ?)",
+                                   [(key, values[key], now) for key in values])
+            if self.max_entries is not None:
+                excess = connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    connection.execute(f"DELETE FROM {self.table} WHERE key IN "
+                                       f"(SELECT key FROM {self.table} ORDER BY used LIMIT ?)", (excess,))
+            connection.commit()
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None and self.pid == os.getpid():
+                self.connection.close()
+            self.connection = None
@@ -0,0 +1,124 @@
+import os
+import numpy as np
+from cache import make_key
+
+# reading the corpus files in data/ (poems in the format <number>poem<number>poem…<END>, reference metres in the same
+# format with one list of stress values per line, and reference rhyme schemes with one list of pairs per line)
+
+# names of the files with the originals and the references in the data directory
+ORIGINALS = "shakespeare_sonnets.txt"
+REFERENCE_METRES = "shakespeare_sonnets_reference_metre.txt"
+REFERENCE_RHYME_SCHEMES = "shakespeare_sonnets_reference_rhyme.txt"
+
+# location of the compiled reference metres and rhyme schemes (set to None to parse the text files on every run)
+compiled_dir = os.path.join("cache", "corpus")
+# version of the compiled format (part of the key, so that changing the format does not reuse old files)
+COMPILED_VERSION = "1"
+
+# get the tags of all conditions in the data directory (i.e. all files except the originals and references)
+def get_condition_tags(data_dir="data"):
+    return sorted(f for f in os.listdir(data_dir)
+                  if f not in [ORIGINALS, REFERENCE_METRES, REFERENCE_RHYME_SCHEMES] and not f.startswith("."))
+
+# stream the poems of a file one by one, reading it in chunks of chunk_size characters
+# (yields the same poems as [x[:x.rfind("<")] for x in open(path).read().split(">")[1:] if len(x) > 3])
+def iter_poems(path, chunk_size=1 << 16):
+    with open(path, "r") as infile:
+        rest = None # text after the last ">" read so far (None before the first ">")
+        while True:
+            chunk = infile.read(chunk_size)
+            if chunk == "":
+                break
+            segments = chunk.split(">")
+            if rest is None:
+                if len(segments) == 1:
+                    continue
+                segments = segments[1:]
+            else:
+                segments[0] = rest + segments[0]
+            rest = segments.pop()
+            for x in segments:
+                if len(x) > 3:
+                    yield x[:x.rfind("<")]
+        if rest is not None and len(rest) > 3:
+            yield rest[:rest.rfind("<")]
+
+# get all poems of a file
+def read_poems(path):
+    return list(iter_poems(path))
+
+# parse the reference metres of a text file: for each poem, a list of lines, each a list of stress values
+def parse_metres(path):
+    return [[[float(z.replace("]","").replace("[","")) for z in y.strip().replace(" ","").split(",") if z != ""]
+             for y in x.split("\n") if y != ""]
+            for x in iter_poems(path)]
+
+# parse the reference rhyme schemes of a text file (where each rhyme scheme is represented as [[line1,line2],…])
+def parse_rhyme_schemes(path):
+    with open(path, "r") as infile:
+        return [[[int(z.replace("]","").replace("[",""))
+                  for z in y.split(",")] for y in x.replace("\n","").replace(" ","").split("],[")] if x != "[]\n"
+                else [] for x in infile]
+
+# nested lists (poems of rows of numbers, e.g. lines of stress values or pairs of rhyming lines) stored in three flat
+# arrays: values holds the numbers of all rows, rows the offset of each row in values and poems the offset of each
+# poem in rows. Indexing returns the nested lists of a poem, so that it can be used like the parsed lists
+class CompiledCorpus:
+    def __init__(self, values, rows, poems):
+        self.values = values
+        self.rows = rows
+        self.poems = poems
+
+    # compile nested lists into arrays
+    @staticmethod
+    def from_lists(poems, dtype):
+        rows = [row for poem in poems for row in poem]
+        return CompiledCorpus(np.array([value for row in rows for value in row], dtype=dtype),
+                              np.cumsum([0] + [len(row) for row in rows], dtype=np.int64),
+                              np.cumsum([0] + [len(poem) for poem in poems], dtype=np.int64))
+
+    def __len__(self):
+        return len(self.poems) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("poem index out of range")
+        rows = self.rows[self.poems[i]:self.poems[i + 1] + 1].tolist()
+        return [self.values[rows[j]:rows[j + 1]].tolist() for j in range(len(rows) - 1)]
+
+    def to_lists(self):
+        return [self[i] for i in range(len(self))]
+
+# get the compiled form of a corpus file (kind "metres" or "rhyme_schemes"), memory-mapped from compiled_dir
+# the compiled arrays are reused as long as the source file is unchanged (same path, size and modification time),
+# otherwise the file is parsed and compiled again
+def load_compiled(path, kind):
+    parse, dtype = {"metres": (parse_metres, np.float64), "rhyme_schemes": (parse_rhyme_schemes, np.int64)}[kind]
+    if compiled_dir is None:
+        return CompiledCorpus.from_lists(parse(path), dtype)
+    stat = os.stat(path)
+    key = make_key(COMPILED_VERSION, kind, os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    names = [os.path.join(compiled_dir, f"{key}.{array}.npy") for array in ["values", "rows", "poems"]]
+    # the poems array is written last, so the compiled form is complete if it exists
+    if not os.path.exists(names[2]):
+        compiled = CompiledCorpus.from_lists(parse(path), dtype)
+        os.makedirs(compiled_dir, exist_ok=True)
+        for name, array in zip(names, [compiled.values, compiled.rows, compiled.poems]):
+            temporary = f"{name}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as outfile:
+                np.save(outfile, array)
+            os.replace(temporary, name)
+        return compiled
+    return CompiledCorpus(*[np.load(name, mmap_mode="r") for name in names])
+
+# get the reference metres of a file (compiled and memory-mapped, see load_compiled)
+def read_metres(path):
+    return load_compiled(path, "metres")
+
+# get the reference rhyme schemes of a file (compiled and memory-mapped, see load_compiled)
+def read_rhyme_schemes(path):
+    return load_compiled(path, "rhyme_schemes")
@@ -1,38 +1,229 @@
+import os
+import time
+import cProfile
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from cache import make_key
+from corpus import ORIGINALS, REFERENCE_METRES, REFERENCE_RHYME_SCHEMES
+from corpus import get_condition_tags, read_metres, read_poems, read_rhyme_schemes
+from features import build_index
+from metrics import METRIC_VERSIONS
+from metrics import CometKiwiScorer
 from metrics import get_cometkiwi
-from metrics import get_metrical_distance
+from metrics import get_metrical_distance_batch
 from metrics import get_rhyme_scheme_similarity
+from phonemes import get_backend, get_version, phonemize_poems
+from profiling import add_throughput, merge_stats, reset, take_stats, timed, write_report
+from results_store import ResultsStore
 
 # evaluate one or more translation(s) according to the three metrics
+# usage: python evaluate_translations.py --data data --tags gpt4o_plain gpt4o_plainform --workers 32
 
-results = open("RESULTS.csv","a") # csv file to write the result to
+# profiler of a worker process (if profiling is switched on) and the file it is written to
+profiler = None
+profile_path = None
 
-# file names are stand-in names
+# set up the espeak backend once in each worker process
+# (and a profiler, whose statistics are written to <profile>.<process id> after each shard, if profile is given)
+def init_worker(lang, profile=None):
+    global profiler, profile_path
+    # the statistics inherited from the main process (when the worker is forked) are not those of the worker
+    reset()
+    if profile is not None:
+        profiler = cProfile.Profile()
+        profile_path = f"{profile}.{os.getpid()}"
+    get_backend(lang)
 
-# get originals from file (of the format <number>poem<number>poem…<end>)
-originals = [x[:x.rfind("<")] for x in open("ORIGINAL_POEMS.txt","r").read().split(">")[1:]]
-# get the reference metres from file (of the same format)
-metres = [[[float(z.replace("]","").replace("[","")) for z in y.strip().replace(" ","").split(",") if z != ""]
-           for y in x[:x.rfind("<")].split("\n") if y != ""]
-          for x in open("REFERENCE_METRES.txt","r").read().split(">")[1:]]
-# get the reference rhyme schemes from file (where each rhyme scheme is represented as [[line1,line2],…]
-rhyme_schemes = [[[int(z.replace("]","").replace("[",""))
-                   for z in y.split(",")] for y in x.replace("\n","").replace(" ","").split("],[")] if x != "[]\n"
-                 else [] for x in open("REFERENCE_RHYME_SCHEMES.txt","r").readlines()]
+# get the input hashes of metrical distance and rhyme scheme similarity of a translation (which include the versions
+# of phonemizer and espeak, as both metrics depend on the transcriptions)
+def get_form_hashes(translation, metre, rhyme_scheme, lang):
+    return make_key(translation, metre, lang, get_version()), make_key(translation, rhyme_scheme, lang, get_version())
 
-candidate_files = [("TRANSLATION.txt", "1"), ("TRANSLATION2.txt", "2")]
+# compute metrical distance and/or rhyme scheme similarity for a shard of work units (each one poem of one condition)
+# a work unit is (tag, index, translation, metre, rhyme scheme, lang, metre input hash, rhyme input hash), where metre
+# or rhyme scheme is None if the respective metric does not have to be computed
+# with features (a dictionary from tag to the Features of the condition, see features.py), the stresses and rhymes
+# are read from the feature index instead of phonemizing the translations
+# returns the results as entries for the results store
+def evaluate_form(units, features=None):
+    start = time.perf_counter()
+    lang = units[0][5]
+    if features is None:
+        translations = [unit[2] for unit in units]
+        # phonemize the translations once and use the transcriptions for both metre and rhyme
+        transcriptions = phonemize_poems(translations, lang=lang)
+        stresses = translations
+        rhymes = translations
+    else:
+        transcriptions = [None] * len(units)
+        stresses = [features[unit[0]].get_stresses(unit[1]) for unit in units]
+        rhymes = [features[unit[0]].get_rhymes(unit[1]) for unit in units]
+    metre_units = [u for u in range(len(units)) if units[u][3] is not None]
+    metrical_distances = get_metrical_distance_batch([stresses[u] for u in metre_units],
+                                                     [units[u][3] for u in metre_units], lang=lang,
+                                                     transcriptions=[transcriptions[u] for u in metre_units])
+    results = []
+    for u in range(len(metre_units)):
+        tag, i, translation, metre, rhyme_scheme, lang, metre_hash, rhyme_hash = units[metre_units[u]]
+        results.append((tag, i + 1, "metrical_distance", METRIC_VERSIONS["metrical_distance"], metre_hash,
+                        metrical_distances[u]))
+    for u in range(len(units)):
+        tag, i, translation, metre, rhyme_scheme, lang, metre_hash, rhyme_hash = units[u]
+        if rhyme_scheme is not None:
+            rhyme_scheme_similarity = get_rhyme_scheme_similarity(rhymes[u], rhyme_scheme, lang=lang,
+                                                                  transcriptions=transcriptions[u])[2]
+            results.append((tag, i + 1, "rhyme_scheme_similarity", METRIC_VERSIONS["rhyme_scheme_similarity"],
+                            rhyme_hash, rhyme_scheme_similarity))
+    # attribute the time to the conditions of the work units (for the throughput of each condition)
+    seconds = time.perf_counter() - start
+    for tag, n in Counter(unit[0] for unit in units).items():
+        add_throughput(f"form/{tag}", n, seconds * n / len(units))
+    return results
 
-for candidate in candidate_files:
-    # get translations (in the same format as for the originals)
-    translations = [x[:x.rfind("<")] for x in open(f"./{candidate[0]}","r").read().split(">")[1:] if len(x) > 3]
+# evaluate a shard of work units in a worker process
+# returns the results and the statistics of the worker process (see profiling.py) since its last shard
+def evaluate_shard(units):
+    if profiler is not None:
+        profiler.enable()
+    try:
+        results = evaluate_form(units)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+    return results, take_stats()
 
-    assert len(translations) == len(originals)
+# evaluate the translations of the given conditions (files data_dir/<tag>) and save the results in a results store
+# - only results whose inputs or metric version have changed since they were stored are (re)computed, so that an
+#   interrupted evaluation can be resumed and adding a condition only evaluates this condition
+# - metre and rhyme are computed for all (condition, poem) work units on a pool of worker processes
+#   (in shards of shard_size work units, which are phonemized and scored in batches, and stored as they finish)
+#   (with index=True, the stresses and rhymes are instead read from the feature index, see features.py, which is
+#   built first for the conditions that are not indexed yet, before the CometKiwi thread is started, and the metrics
+#   are computed in this process)
+# - in the meantime, CometKiwi is computed for all conditions at once in a separate thread (unless cometkiwi=False)
+# - timers, counters and throughputs of all stages (also those of the worker processes) are collected in profiling.py,
+#   and the worker processes are profiled with cProfile if profile (a path prefix for their profiles) is given
+# returns the rows (tag, poem number, cometkiwi, metrical distance, rhyme scheme similarity) of the given conditions
+def evaluate(data_dir="data", tags=None, store="results.sqlite", workers=None, lang="de", scorer=None, cometkiwi=True,
+             shard_size=16, index=False, profile=None):
+    if tags is None:
+        tags = get_condition_tags(data_dir)
+    with timed("read_corpus"):
+        originals = read_poems(os.path.join(data_dir, ORIGINALS))
+        metres = read_metres(os.path.join(data_dir, REFERENCE_METRES))
+        rhyme_schemes = read_rhyme_schemes(os.path.join(data_dir, REFERENCE_RHYME_SCHEMES))
+        translations = {}
+        for tag in tags:
+            translations[tag] = read_poems(os.path.join(data_dir, tag))
+            assert len(translations[tag]) == len(originals), f"{tag}: {len(translations[tag])} poems instead of " \
+                                                             f"{len(originals)}"
+    if type(store) is str:
+        store = ResultsStore(store)
+    if cometkiwi and scorer is None:
+        scorer = CometKiwiScorer()
 
-    cometkiwi_scores = get_cometkiwi(originals, translations)
+    # find the results that have to be (re)computed
+    with timed("find_missing_results"):
+        entries = store.get_entries(tags)
+        def is_stored(tag, i, metric, input_hash):
+            return entries.get((tag, i + 1, metric)) == (METRIC_VERSIONS[metric], input_hash)
 
-    for i in range(len(originals)):
-        metrical_distance = get_metrical_distance(translations[i], metres[i], lang="de")
-        rhyme_scheme_similarity = get_rhyme_scheme_similarity(translations[i], rhyme_schemes[i], lang="de")[2]
+        form_units = []
+        cometkiwi_units = []
+        for tag in tags:
+            for i in range(len(originals)):
+                metre_hash, rhyme_hash = get_form_hashes(translations[tag][i], metres[i], rhyme_schemes[i], lang)
+                metre = None if is_stored(tag, i, "metrical_distance", metre_hash) else metres[i]
+                rhyme_scheme = None if is_stored(tag, i, "rhyme_scheme_similarity", rhyme_hash) else rhyme_schemes[i]
+                if metre is not None or rhyme_scheme is not None:
+                    form_units.append((tag, i, translations[tag][i], metre, rhyme_scheme, lang, metre_hash,
+                                       rhyme_hash))
+                if cometkiwi:
+                    cometkiwi_hash = make_key(originals[i], translations[tag][i], scorer.model_id)
+                    if not is_stored(tag, i, "cometkiwi", cometkiwi_hash):
+                        cometkiwi_units.append((tag, i, cometkiwi_hash))
 
-        results.write(",".join([candidate[1], str(i), str(cometkiwi_scores[i]), str(metrical_distance),
-                                str(rhyme_scheme_similarity), "\n"]))
-results.close()
\ No newline at end of file
+    shards = [form_units[start:start + shard_size] for start in range(0, len(form_units), shard_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(lang, profile)) as executor, \
+            ThreadPoolExecutor(max_workers=1) as cometkiwi_executor:
+        # the worker processes (of the pool, or of the feature index) are forked before the CometKiwi thread loads
+        # the model, as forking while torch runs in another thread can deadlock the workers
+        if not index:
+            futures = [executor.submit(evaluate_shard, shard) for shard in shards]
+        elif len(form_units) > 0:
+            features = build_index(data_dir=data_dir, tags=list(dict.fromkeys(u[0] for u in form_units)), lang=lang,
+                                   workers=workers)
+
+        # CometKiwi stage (the model is loaded only once, for all conditions)
+        def score_cometkiwi():
+            start = time.perf_counter()
+            scores = get_cometkiwi([originals[i] for tag, i, h in cometkiwi_units],
+                                   [translations[tag][i] for tag, i, h in cometkiwi_units], scorer=scorer)
+            add_throughput("cometkiwi", len(cometkiwi_units), time.perf_counter() - start)
+            return scores
+        if len(cometkiwi_units) > 0:
+            cometkiwi_future = cometkiwi_executor.submit(score_cometkiwi)
+
+        if index:
+            for shard in shards:
+                store.put(evaluate_form(shard, features))
+        else:
+            for future in as_completed(futures):
+                results, stats = future.result()
+                merge_stats(stats)
+                store.put(results)
+
+        if len(cometkiwi_units) > 0:
+            scores = cometkiwi_future.result()
+            store.put([(cometkiwi_units[u][0], cometkiwi_units[u][1] + 1, "cometkiwi", METRIC_VERSIONS["cometkiwi"],
+                        cometkiwi_units[u][2], scores[u]) for u in range(len(cometkiwi_units))])
+
+    return store.get_rows(tags)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate translations according to CometKiwi, metrical distance "
+                                                 "and rhyme scheme similarity.")
+    parser.add_argument("--data", default="data", help="directory with the originals, references and translations")
+    parser.add_argument("--tags", nargs="*", default=None,
+                        help="tags of the conditions to evaluate (file names in the data directory; default: all)")
+    parser.add_argument("--store", default="results.sqlite", help="results store (SQLite database)")
+    parser.add_argument("--export", default=None, help="csv file to write the results of the evaluated conditions to")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes for metre and rhyme")
+    parser.add_argument("--lang", default="de", help="language of the translations")
+    parser.add_argument("--index", action="store_true",
+                        help="compute metre and rhyme from the feature index (built first if necessary)")
+    parser.add_argument("--report", default=None,
+                        help="JSON file to write a report of the run to (times, counters, cache hit rates, throughput)")
+    parser.add_argument("--profile", default=None,
+                        help="file to write a cProfile profile of the run to (the profiles of the worker processes "
+                             "are written to <file>.<process id>)")
+    parser.add_argument("--no-cometkiwi", action="store_true", help="only compute metre and rhyme")
+    parser.add_argument("--checkpoint", default=None,
+                        help="path to a local CometKiwi checkpoint (for machines without network access)")
+    parser.add_argument("--batch-size", type=int, default=16, help="batch size for CometKiwi")
+    parser.add_argument("--gpus", type=int, default=1, help="number of GPUs for CometKiwi (0 for the CPU)")
+    parser.add_argument("--comet-workers", type=int, default=None, help="number of data loader workers for CometKiwi")
+    args = parser.parse_args()
+
+    scorer = None
+    if not args.no_cometkiwi:
+        scorer = CometKiwiScorer(checkpoint_path=args.checkpoint, batch_size=args.batch_size, gpus=args.gpus,
+                                 num_workers=args.comet_workers)
+    store = ResultsStore(args.store)
+    start = time.perf_counter()
+    main_profiler = cProfile.Profile() if args.profile is not None else None
+    if main_profiler is not None:
+        main_profiler.enable()
+    rows = evaluate(data_dir=args.data, tags=args.tags, store=store, workers=args.workers, lang=args.lang,
+                    scorer=scorer, cometkiwi=not args.no_cometkiwi, index=args.index, profile=args.profile)
+    if main_profiler is not None:
+        main_profiler.disable()
+        main_profiler.dump_stats(args.profile)
+    if args.report is not None:
+        write_report(args.report, seconds=time.perf_counter() - start, rows=len(rows), workers=args.workers,
+                     index=args.index, cometkiwi=not args.no_cometkiwi)
+    if args.export is not None:
+        store.export_csv(args.export, conditions=args.tags)
+    store.close()
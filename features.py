@@ -0,0 +1,164 @@
+import os
+import json
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from cache import make_key
+from corpus import CompiledCorpus, get_condition_tags, read_poems
+from metrics import get_rhyme_batch, get_stresses_batch
+from phonemes import get_backend, get_version, phonemize_poems
+from profiling import merge_stats, reset, take_stats
+
+# feature index: the per-line features of the translations in data/ (phonemes, stress values from get_stresses and
+# (rhyme, onset) from get_rhyme), computed once and stored in columns of flat arrays, so that the metrics can be
+# computed (e.g. for different metrics or references) without phonemizing the texts again
+# usage: python features.py --data data --tags gpt4o_plain gpt4o_plainform --workers 8
+
+# location of the feature index
+index_dir = os.path.join("cache", "features")
+# version of the features (part of the signature of an index, increase it when get_stresses or get_rhyme change)
+FEATURES_VERSION = "1"
+
+# encode a list of strings as a column: the UTF-8 bytes of all strings and the offset of each string
+def encode_strings(strings):
+    data = [s.encode("utf-8") for s in strings]
+    return np.frombuffer(b"".join(data), dtype=np.uint8), np.cumsum([0] + [len(d) for d in data], dtype=np.int64)
+
+# decode the strings start to end - 1 of a column
+def decode_strings(data, offsets, start, end):
+    offsets = offsets[start:end + 1].tolist()
+    text = data[offsets[0]:offsets[-1]].tobytes()
+    return [text[offsets[i] - offsets[0]:offsets[i + 1] - offsets[0]].decode("utf-8") for i in range(end - start)]
+
+# get the directory of the index of a condition file
+def get_index_path(path):
+    return os.path.join(index_dir, f"{os.path.basename(path)}.{make_key(os.path.abspath(path))[:16]}")
+
+# get the signature of the index of a condition file, which changes if the file, the language, the features or the
+# versions of phonemizer and espeak change
+def get_signature(path, lang):
+    stat = os.stat(path)
+    return {"features": FEATURES_VERSION, "transcriptions": get_version(), "lang": lang, "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns}
+
+# check whether the index of a condition file exists and is up to date
+def is_indexed(path, lang="de"):
+    signature_path = os.path.join(get_index_path(path), "signature.json")
+    if not os.path.exists(signature_path):
+        return False
+    with open(signature_path, "r") as infile:
+        return json.load(infile) == get_signature(path, lang)
+
+# compute the features of all lines of a condition file and write them to its index
+# (lines are those of poem.split("\n"), including empty lines, so that line numbers are the same as in the texts)
+def index_condition(path, lang="de"):
+    signature = get_signature(path, lang)
+    poems = read_poems(path)
+    transcriptions = phonemize_poems(poems, lang=lang)
+    lines = [poem.split("\n") for poem in poems]
+    line_transcriptions = [t for poem in transcriptions for t in poem]
+    nonempty = [line.strip() != "" for poem in lines for line in poem]
+    # the stresses and rhymes of all lines of the condition at once
+    line_stresses = get_stresses_batch(line_transcriptions, lang=lang)
+    rhymes = [rhyme if nonempty[j] else ("", "")
+              for j, rhyme in enumerate(get_rhyme_batch(line_transcriptions, lang=lang))]
+    stresses = []
+    start = 0
+    for poem in lines:
+        stresses.append(line_stresses[start:start + len(poem)])
+        start += len(poem)
+    compiled = CompiledCorpus.from_lists(stresses, np.float64)
+    phonemes, phoneme_offsets = encode_strings(line_transcriptions)
+    rhyme_data, rhyme_offsets = encode_strings([r[0] for r in rhymes])
+    onsets, onset_offsets = encode_strings([r[1] for r in rhymes])
+    columns = {"poems": compiled.poems, "stresses": compiled.values, "stress_offsets": compiled.rows,
+               "phonemes": phonemes, "phoneme_offsets": phoneme_offsets, "rhymes": rhyme_data,
+               "rhyme_offsets": rhyme_offsets, "onsets": onsets, "onset_offsets": onset_offsets,
+               "nonempty": np.array(nonempty, dtype=bool)}
+    # the signature is written last, so the index is complete if it exists
+    directory = get_index_path(path)
+    os.makedirs(directory, exist_ok=True)
+    if os.path.exists(os.path.join(directory, "signature.json")):
+        os.remove(os.path.join(directory, "signature.json"))
+    for name in columns:
+        temporary = os.path.join(directory, f"{name}.{os.getpid()}.tmp")
+        with open(temporary, "wb") as outfile:
+            np.save(outfile, columns[name])
+        os.replace(temporary, os.path.join(directory, f"{name}.npy"))
+    with open(os.path.join(directory, "signature.json"), "w") as outfile:
+        json.dump(signature, outfile)
+    return path
+
+# the features of a condition, read from its index (memory-mapped)
+class Features:
+    def __init__(self, path):
+        directory = get_index_path(path)
+        self.columns = {name[:-4]: np.load(os.path.join(directory, name), mmap_mode="r")
+                        for name in os.listdir(directory) if name.endswith(".npy")}
+        self.stresses = CompiledCorpus(self.columns["stresses"], self.columns["stress_offsets"],
+                                       self.columns["poems"])
+
+    def __len__(self):
+        return len(self.stresses)
+
+    # get the range of the lines of a poem
+    def get_lines(self, i):
+        return int(self.columns["poems"][i]), int(self.columns["poems"][i + 1])
+
+    # get the transcriptions of all lines of a poem (as returned by phonemes.phonemize_poem)
+    def get_transcriptions(self, i):
+        return decode_strings(self.columns["phonemes"], self.columns["phoneme_offsets"], *self.get_lines(i))
+
+    # get the stress values of the lines of a poem (as returned by metrics.get_poem_stresses, i.e. without the lines
+    # that have no stress values), to be passed to the metrical distance instead of the text
+    def get_stresses(self, i):
+        return [x for x in self.stresses[i] if x != []]
+
+    # get the (rhyme, onset) pairs of the non-empty lines of a poem, to be passed to the rhyme scheme (similarity)
+    # instead of the text
+    def get_rhymes(self, i):
+        start, end = self.get_lines(i)
+        rhymes = decode_strings(self.columns["rhymes"], self.columns["rhyme_offsets"], start, end)
+        onsets = decode_strings(self.columns["onsets"], self.columns["onset_offsets"], start, end)
+        nonempty = self.columns["nonempty"][start:end].tolist()
+        return [(rhymes[j], onsets[j]) for j in range(end - start) if nonempty[j]]
+
+# set up the espeak backend once in each worker process
+def init_worker(lang):
+    # the statistics inherited from the main process (when the worker is forked) are not those of the worker
+    reset()
+    get_backend(lang)
+
+# index a condition file in a worker process
+# returns the statistics of the worker process (see profiling.py) since its last condition
+def index_shard(path, lang="de"):
+    index_condition(path, lang=lang)
+    return take_stats()
+
+# index the given conditions (files data_dir/<tag>, by default all conditions), on a pool of worker processes
+# conditions whose index is up to date are not indexed again (the statistics of the worker processes are merged into
+# those of this process)
+# returns a dictionary from tag to the Features of the condition
+def build_index(data_dir="data", tags=None, lang="de", workers=None):
+    if tags is None:
+        tags = get_condition_tags(data_dir)
+    paths = {tag: os.path.join(data_dir, tag) for tag in tags}
+    missing = [paths[tag] for tag in tags if not is_indexed(paths[tag], lang=lang)]
+    if len(missing) > 0:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(lang,)) as executor:
+            for stats in executor.map(index_shard, missing, [lang] * len(missing)):
+                merge_stats(stats)
+    return {tag: Features(paths[tag]) for tag in tags}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index the per-line phonemes, stresses and rhymes of translations.")
+    parser.add_argument("--data", default="data", help="directory with the translations")
+    parser.add_argument("--tags", nargs="*", default=None,
+                        help="tags of the conditions to index (file names in the data directory; default: all)")
+    parser.add_argument("--lang", default="de", help="language of the translations")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+
+    features = build_index(data_dir=args.data, tags=args.tags, lang=args.lang, workers=args.workers)
+    for tag in features:
+        print(f"{tag}: {len(features[tag])} poems, {len(features[tag].columns['nonempty'])} lines")
@@ -1,103 +1,422 @@
-from openai import OpenAI
-from string import digits
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from openai import OpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from cache import SQLiteCache, make_key
+from corpus import read_poems
 
 client = OpenAI(
     api_key='INSERT_API_KEY_HERE'
 )
 
+# limits the number of requests and tokens per minute (over a sliding window of 60 seconds)
+# can be shared by several threads; the number of tokens of a request is estimated from the length of its prompt
+# and corrected with the actual usage once the response has arrived
+class RateLimiter:
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = deque() # [time, tokens] of the requests in the last 60 seconds
+        self.lock = threading.Lock()
+
+    # wait until a request with the given (estimated) number of tokens is allowed, then record it
+    # returns the record of the request, to be passed to update once the actual number of tokens is known
+    def acquire(self, tokens):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                while len(self.window) > 0 and self.window[0][0] <= now - 60:
+                    self.window.popleft()
+                used = sum(r[1] for r in self.window)
+                if (self.requests_per_minute is None or len(self.window) < self.requests_per_minute) and \
+                        (self.tokens_per_minute is None or len(self.window) == 0 or
+                         used + tokens <= self.tokens_per_minute):
+                    record = [now, tokens]
+                    self.window.append(record)
+                    return record
+                wait = self.window[0][0] + 60 - now
+            time.sleep(max(wait, 0.01))
+
+    def update(self, record, tokens):
+        with self.lock:
+            record[1] = tokens
+
+rate_limiter = None # set to a RateLimiter to limit the requests of all conditions
+max_retries = 5 # number of retries of a request after transient errors (rate limits, timeouts, server errors)
+retry_delay = 1.0 # delay before the first retry in seconds (doubled for each further retry)
+
+response_cache_path = os.path.join("cache", "responses.sqlite") # on-disk cache of responses (None to disable)
+offline = False # offline replay: only use cached responses and fail for requests that are not in the cache
+response_cache = None
+batch_requests = None # when collecting requests for a batch: key -> body of the requests not answered yet
+in_flight = {} # requests currently being sent: key -> [event set when done, response, exception if failed]
+in_flight_lock = threading.Lock()
+
+# raised by request when a response has no content (e.g. a refusal, a tool call or a content filter)
+class EmptyResponse(Exception):
+    pass
+
+# send a chat completion request and return the content of the response
+# (respecting the rate limiter and retrying with exponential backoff after transient errors)
+def request(messages, model, **params):
+    for attempt in range(max_retries + 1):
+        record = None
+        if rate_limiter is not None:
+            record = rate_limiter.acquire(sum(len(m["content"]) for m in messages) // 4)
+        try:
+            chat = client.chat.completions.create(model=model, messages=messages, **params)
+        except (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError):
+            if attempt == max_retries:
+                raise
+            time.sleep(retry_delay * 2 ** attempt * (1 + random.random()))
+            continue
+        if record is not None and chat.usage is not None:
+            rate_limiter.update(record, chat.usage.total_tokens)
+        if chat.choices[0].message.content is None:
+            raise EmptyResponse(f"response of {model} without content "
+                                f"(finish reason: {chat.choices[0].finish_reason})")
+        return chat.choices[0].message.content
+
+# raised by complete when collecting requests for a batch and the response to a request is not known yet
+class PendingRequest(Exception):
+    pass
+
+# get the response cache (None if caching is disabled)
+def get_response_cache():
+    global response_cache
+    if response_cache_path is None:
+        return None
+    if response_cache is None or response_cache.path != response_cache_path:
+        response_cache = SQLiteCache(response_cache_path, table="responses", max_entries=None)
+    return response_cache
+
+# get the content of the response to a chat completion request (used by all conditions)
+# responses are cached on disk, keyed by (API base url, model, messages, sampling parameters), so that repeated
+# requests (e.g. the analysis of the same poem for different conditions, or a rerun of a condition) are only sent once
+# identical requests sent at the same time from different threads are also only sent once (if that request fails, the
+# waiting threads fail with the same exception); failed requests are not cached
+def complete(messages, model, **params):
+    key = make_key(client.base_url, model, json.dumps(messages, sort_keys=True), json.dumps(params, sort_keys=True))
+    cache = get_response_cache()
+    if cache is not None:
+        found = cache.get([key])
+        if key in found:
+            return found[key]
+    if batch_requests is not None:
+        batch_requests[key] = {"model": model, "messages": messages, **params}
+        raise PendingRequest(key)
+    if offline:
+        raise LookupError(f"offline replay: no cached response for request {key} to {model}")
+
+    with in_flight_lock:
+        entry = in_flight.get(key)
+        owner = entry is None
+        if owner:
+            entry = in_flight[key] = [threading.Event(), None, None]
+    if not owner:
+        entry[0].wait()
+        if entry[2] is not None:
+            raise entry[2]
+        return entry[1]
+
+    try:
+        entry[1] = request(messages, model, **params)
+        if cache is not None:
+            cache.put({key: entry[1]})
+    except Exception as e:
+        entry[2] = e
+        raise
+    finally:
+        with in_flight_lock:
+            del in_flight[key]
+        entry[0].set()
+    return entry[1]
+
 # definitions for the individual conditions
 def plain(original, model):
     prompt = f"Please translate the following poem to German: \n\n{original}"
     messages = [{"role": "user", "content": prompt}]
-    chat = client.chat.completions.create(model=model, messages=messages)
-    translation = chat.choices[0].message.content
+    translation = complete(messages, model)
     return translation
 
 def plainform(original, model):
     prompt = f"Please translate the following poem to German. Please make sure that your translation reproduces the form of the original (rhyme and meter): \n\n{original}"
     messages = [{"role": "user", "content": prompt}]
-    chat = client.chat.completions.create(model=model, messages=messages)
-    translation = chat.choices[0].message.content
+    translation = complete(messages, model)
     return translation
 
 def plainmeaning(original, model):
     prompt = f"Please translate the following poem to German. Please make sure that your translation reproduces the meaning of the original as closely as possible: \n\n{original}"
     messages = [{"role": "user", "content": prompt}]
-    chat = client.chat.completions.create(model=model, messages=messages)
-    translation = chat.choices[0].message.content
+    translation = complete(messages, model)
     return translation
 
 # can also be used for the conditions "IterativeMixed" and "IterForm2Steps", depending on the input translations
 def iterativeform(original, attempt, model):
     prompt = f"You are provided with an English poem and an attempt at a German translation. Please suggest a translation to German that reproduces the form of the original (rhyme and meter) better.\n\nOriginal:\n\n{original}\n\nAttempt at translation:\n\n{attempt}"
     messages = [{"role": "user", "content": prompt}]
-    chat = client.chat.completions.create(model=model, messages=messages)
-    translation = chat.choices[0].message.content
+    translation = complete(messages, model)
     return translation
 
 def iterativemeaning(original, attempt, model):
     prompt = f"You are provided with an English poem and an attempt at a German translation. Please suggest a translation to German that reproduces the meaning of the original better.\n\nOriginal:\n\n{original}\n\nAttempt at translation:\n\n{attempt}"
     messages = [{"role": "user", "content": prompt}]
-    chat = client.chat.completions.create(model=model, messages=messages)
-    translation = chat.choices[0].message.content
+    translation = complete(messages, model)
     return translation
 
+# the analysis of metre and rhyme of the original, shared by analysisrewrite and analysistranslate (thanks to the
+# response cache, it is only requested once per poem and model for both conditions)
+def analyse(original, model):
+    prompt = f"Please tell me the meter and rhyme of the following poem (in the format: \"Meter: [meter]; Rhyme scheme: [rhyme scheme]\").\n\nPoem:\n{original}\n\n"
+    messages = [{"role": "user", "content": prompt}]
+    description = complete(messages, model)
+    return description
+
 def analysisrewrite(original, candidate_translation, model, return_description=False):
-    prompt1 = f"Please tell me the meter and rhyme of the following poem (in the format: \"Meter: [meter]; Rhyme scheme: [rhyme scheme]\").\n\nPoem:\n{original}\n\n"
-    messages = [{"role": "user", "content": prompt1}]
-    chat = client.chat.completions.create(model=model, messages=messages)
-    description = chat.choices[0].message.content
+    description = analyse(original, model)
     prompt2 = f"Please translate the following to German:\n\n{description}"
     messages = [{"role": "user", "content": prompt2}]
-    chat = client.chat.completions.create(model=model, messages=messages)
-    german_description = chat.choices[0].message.content
+    german_description = complete(messages, model)
     prompt3 = f"Bitte schreiben Sie den folgenden Text in ein Gedicht mit den folgenden Eigenschaften um:\n\n{german_description}\n\nText:\n{candidate_translation}\n\n"
     messages = [{"role": "user", "content": prompt3}]
-    chat = client.chat.completions.create(model=model, messages=messages)
-    improved_translation = chat.choices[0].message.content
+    improved_translation = complete(messages, model)
     if return_description:
         return improved_translation, description, german_description
     return improved_translation
 
 def analysistranslate(original, model, return_description=False):
-    prompt1 = f"Please tell me the meter and rhyme of the following poem (in the format: \"Meter: [meter]; Rhyme scheme: [rhyme scheme]\").\n\nPoem:\n{original}\n\n"
-    messages = [{"role": "user", "content": prompt1}]
-    chat = client.chat.completions.create(model=model, messages=messages)
-    description = chat.choices[0].message.content
+    description = analyse(original, model)
     prompt2 = f"Please translate the poem below to German. Please make sure to reproduce the meter and rhyme scheme of the original, making use of the given additional information.\n\nInformation on meter and rhyme scheme:\n{description}\n\nPoem:\n{original}\n\n"
     messages = [{"role": "user", "content": prompt2}]
-    chat = client.chat.completions.create(model=model, messages=messages)
-    translation = chat.choices[0].message.content
+    translation = complete(messages, model)
     if return_description:
         return translation, description
     return translation
 
-if __name__ == "__main__":
-    iterative = True # True for iterative conditions, where there is a candidate translation to improve upon
-    model = "gpt-4o" # insert the model name
+# the conditions: name -> (function, whether it improves upon a seed translation)
+CONDITIONS = {"plain": (plain, False), "plainform": (plainform, False), "plainmeaning": (plainmeaning, False),
+              "iterativeform": (iterativeform, True), "iterativemeaning": (iterativemeaning, True),
+              "analysisrewrite": (analysisrewrite, True), "analysistranslate": (analysistranslate, False)}
 
-    remove_digits = str.maketrans('', '', digits)
+# generate translations for all input poems with a condition, with up to `concurrency` poems at the same time
+# (each poem's requests, e.g. the three chained calls of analysisrewrite, are sent one after the other, but
+# interleaved with the requests for other poems)
+# every finished poem is appended to the checkpoint file (with the condition and the model), so that a rerun only
+# generates the missing poems; poems of the checkpoint from another condition or model are generated again
+# returns the list of translations (None for poems that failed)
+async def generate(condition, input_poems, model, checkpoint, concurrency=8):
+    function = CONDITIONS[condition][0]
+    translations = [None] * len(input_poems)
+    if os.path.exists(checkpoint):
+        skipped = 0
+        for line in open(checkpoint, "r"):
+            entry = json.loads(line)
+            if entry.get("condition") == condition and entry.get("model") == model:
+                translations[entry["index"]] = entry["translation"]
+            else:
+                skipped += 1
+        if skipped > 0:
+            print(f"skipped {skipped} entries of {checkpoint} from another condition or model")
+    # the (blocking) requests of each poem are sent from a pool of `concurrency` threads
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
 
-    original_poems = "".join(open("data/shakespeare_yale", "r").readlines()).replace("END", "").translate(
-        remove_digits).split("<>")[1:-1]
+    async def translate(i):
+        try:
+            translation = await loop.run_in_executor(executor, partial(function, *input_poems[i], model=model))
+        except Exception as e:
+            print(f"poem {i+1} failed: {e!r}")
+            return
+        translations[i] = translation
+        with open(checkpoint, "a") as outfile:
+            outfile.write(json.dumps({"index": i, "condition": condition, "model": model,
+                                      "translation": translation}) + "\n")
 
-    if iterative:
-        # for conditions that derive a translation iteratively from a previous attempt, this is the previous attempt
-        seed_translations = "".join(open("PATH_TO_SEED_TRANSLATION", "r").readlines()).replace("END",
-                                                                                                     "").translate(
-            remove_digits).split("<>")[1:-1]
+    await asyncio.gather(*[translate(i) for i in range(len(input_poems)) if translations[i] is None])
+    executor.shutdown()
+    return translations
 
-        input_poems = [(original_poems[i], seed_translations[i]) for i in range(len(original_poems))]
+# write translations to a file in the format <number>translation<number>translation…<END> (as in data/)
+def write_translations(translations, path):
+    with open(path, "w") as outfile:
+        for c in range(len(translations)):
+            outfile.write("<" + str(c+1) + ">\n" + str(translations[c]) + "\n")
+        outfile.write("<END>\n")
+
+# batch mode (for the OpenAI Batch API): the requests of a condition are collected in a batch input file, and the
+# responses from the batch output file are added to the response cache. Multi-step conditions (e.g. analysisrewrite)
+# are processed in successive batches: each time the batch is built, every poem runs as far as the cached responses
+# allow, and the next request of each unfinished poem goes into the new batch.
+
+# build the next batch for a condition and write it to path (in the JSONL format of the Batch API)
+# returns the translations (None for poems that are not finished yet) and the number of requests in the batch
+def build_batch(condition, input_poems, model, path):
+    global batch_requests
+    if get_response_cache() is None:
+        raise ValueError("batch mode requires the response cache")
+    function = CONDITIONS[condition][0]
+    batch_requests = {}
+    translations = []
+    try:
+        for poem in input_poems:
+            try:
+                translations.append(function(*poem, model=model))
+            except PendingRequest:
+                translations.append(None)
+        requests = batch_requests
+    finally:
+        batch_requests = None
+    if len(requests) > 0:
+        with open(path, "w") as batch_file:
+            for key in requests:
+                # the key of the request in the response cache serves as custom id
+                batch_file.write(json.dumps({"custom_id": key, "method": "POST", "url": "/v1/chat/completions",
+                                             "body": requests[key]}) + "\n")
+    return translations, len(requests)
+
+# upload a batch input file and create the batch, returns the id of the batch
+def submit_batch(path):
+    batch_input = client.files.create(file=open(path, "rb"), purpose="batch")
+    batch = client.batches.create(input_file_id=batch_input.id, endpoint="/v1/chat/completions",
+                                  completion_window="24h")
+    return batch.id
+
+# download the output file of a batch if it is completed, returns the status of the batch
+def download_batch(batch_id, output_path):
+    batch = client.batches.retrieve(batch_id)
+    if batch.status == "completed" and batch.output_file_id is not None:
+        with open(output_path, "w") as outfile:
+            outfile.write(client.files.content(batch.output_file_id).text)
+    return batch.status
+
+# add the responses in a batch output file to the response cache
+# returns the number of responses added and the number of failed requests (which go into the next batch again)
+# (responses without content, e.g. refusals, count as failed and are not added)
+def ingest_batch(path):
+    responses = {}
+    failed = 0
+    for line in open(path, "r"):
+        if line.strip() == "":
+            continue
+        entry = json.loads(line)
+        content = None
+        if entry.get("error") is None and entry["response"]["status_code"] == 200:
+            content = entry["response"]["body"]["choices"][0]["message"]["content"]
+        if content is not None:
+            responses[entry["custom_id"]] = content
+        else:
+            failed += 1
+    get_response_cache().put(responses)
+    return len(responses), failed
+
+# local stand-in for the batch endpoint: send the requests of a batch input file (e.g. to a local OpenAI-compatible
+# server) and write the responses to an output file in the format of the Batch API
+def run_batch(path, output_path, concurrency=8):
+    entries = [json.loads(line) for line in open(path, "r") if line.strip() != ""]
+
+    def run(entry):
+        body = dict(entry["body"])
+        model = body.pop("model")
+        messages = body.pop("messages")
+        try:
+            content = request(messages, model, **body)
+        except Exception as e:
+            return {"id": entry["custom_id"], "custom_id": entry["custom_id"], "response": None,
+                    "error": {"code": type(e).__name__, "message": str(e)}}
+        return {"id": entry["custom_id"], "custom_id": entry["custom_id"], "error": None,
+                "response": {"status_code": 200, "request_id": entry["custom_id"],
+                             "body": {"object": "chat.completion", "model": model,
+                                      "choices": [{"index": 0, "finish_reason": "stop",
+                                                   "message": {"role": "assistant", "content": content}}]}}}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outputs = list(executor.map(run, entries))
+    with open(output_path, "w") as outfile:
+        for output in outputs:
+            outfile.write(json.dumps(output) + "\n")
+
+# add the command line arguments for the requests (API, rate limits, retries and response cache) to a parser
+def add_request_arguments(parser):
+    parser.add_argument("--requests-per-minute", type=int, default=None, help="maximum number of requests per minute")
+    parser.add_argument("--tokens-per-minute", type=int, default=None, help="maximum number of tokens per minute")
+    parser.add_argument("--max-retries", type=int, default=5, help="number of retries after transient errors")
+    parser.add_argument("--base-url", default=None, help="base url of an OpenAI-compatible API (e.g. a local server)")
+    parser.add_argument("--api-key", default=None, help="API key (default: OPENAI_API_KEY or the key given above)")
+    parser.add_argument("--cache", default=response_cache_path, help="on-disk cache of responses")
+    parser.add_argument("--no-cache", action="store_true", help="do not cache responses")
+    parser.add_argument("--offline", action="store_true",
+                        help="offline replay: only use cached responses (e.g. to reproduce an experiment)")
+
+# set up the client, rate limiter, retries and response cache from the parsed command line arguments
+def configure(args):
+    global client, rate_limiter, max_retries, response_cache_path, offline
+    if args.base_url is not None or args.api_key is not None or "OPENAI_API_KEY" in os.environ:
+        client = OpenAI(api_key=args.api_key or os.environ.get("OPENAI_API_KEY", 'INSERT_API_KEY_HERE'),
+                        base_url=args.base_url)
+    rate_limiter = RateLimiter(args.requests_per_minute, args.tokens_per_minute)
+    max_retries = args.max_retries
+    response_cache_path = None if args.no_cache else args.cache
+    offline = args.offline
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate translations of the sonnets with one of the conditions.")
+    parser.add_argument("--condition", default="plain", choices=list(CONDITIONS), help="the condition to use")
+    parser.add_argument("--model", default="gpt-4o", help="the model name")
+    parser.add_argument("--originals", default="data/shakespeare_yale", help="file with the original poems")
+    parser.add_argument("--seed", default="PATH_TO_SEED_TRANSLATION",
+                        help="file with the previous attempts (for conditions that improve upon a seed translation)")
+    parser.add_argument("--output", default="output_translations.txt", help="file to write the translations to")
+    parser.add_argument("--checkpoint", default=None,
+                        help="file with the finished poems, to resume an interrupted run (default: OUTPUT.checkpoint)")
+    parser.add_argument("--concurrency", type=int, default=8, help="maximum number of poems translated at once")
+    add_request_arguments(parser)
+    parser.add_argument("--batch", default=None, choices=["build", "submit", "download", "ingest", "run"],
+                        help="batch mode: build the next batch input file of the condition (or write the output "
+                             "once all poems are finished), submit it, download the output of a batch, ingest a "
+                             "batch output file into the response cache, or run a batch input file locally")
+    parser.add_argument("--batch-file", default="batch_input.jsonl", help="batch input file")
+    parser.add_argument("--batch-output", default="batch_output.jsonl", help="batch output file")
+    parser.add_argument("--batch-id", default=None, help="id of the batch to download")
+    args = parser.parse_args()
+
+    configure(args)
+
+    if args.batch == "submit":
+        print(f"submitted batch {submit_batch(args.batch_file)}")
+    elif args.batch == "download":
+        print(f"batch {args.batch_id}: {download_batch(args.batch_id, args.batch_output)}")
+    elif args.batch == "ingest":
+        print("added %d responses to the cache (%d requests failed)" % ingest_batch(args.batch_output))
+    elif args.batch == "run":
+        run_batch(args.batch_file, args.batch_output, concurrency=args.concurrency)
     else:
-        input_poems = [(original_poems[i]) for i in range(len(original_poems))]
-    output_translations = []
-
-    for p in input_poems:
-        # use whichever condition is intended instead
-        t = plain(p[0], model=model)
-        # t = iterativeform(p[0], p[1], model=model) # use p[1] for seed translations
-        output_translations.append(t)
-
-    with open("output_translations.txt", "a") as outfile:
-        for c in range(len(output_translations)):
-            outfile.write("<" + str(c+1) + ">\n" + str(output_translations[c]) + "\n")
\ No newline at end of file
+        original_poems = read_poems(args.originals)
+        if CONDITIONS[args.condition][1]:
+            # for conditions that derive a translation iteratively from a previous attempt, this is the previous attempt
+            seed_translations = read_poems(args.seed)
+            input_poems = [(original_poems[i], seed_translations[i]) for i in range(len(original_poems))]
+        else:
+            input_poems = [(original_poems[i],) for i in range(len(original_poems))]
+
+        if args.batch == "build":
+            output_translations, number_of_requests = build_batch(args.condition, input_poems, args.model,
+                                                                  args.batch_file)
+            if number_of_requests > 0:
+                print(f"wrote {number_of_requests} requests to {args.batch_file} (submit it and ingest the output, "
+                      f"then build again)")
+        else:
+            checkpoint = args.checkpoint or args.output + ".checkpoint"
+            output_translations = asyncio.run(generate(args.condition, input_poems, args.model, checkpoint,
+                                                       concurrency=args.concurrency))
+            missing = [i + 1 for i in range(len(output_translations)) if output_translations[i] is None]
+            if len(missing) > 0:
+                print(f"{len(missing)} poems could not be translated (rerun to resume): {missing}")
+        if None not in output_translations:
+            write_translations(output_translations, args.output)
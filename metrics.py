@@ -1,47 +1,59 @@
-import phonemizer
-from numpy import ndarray
+import os
+import re
+from numpy import arange, array, cumsum, empty, minimum, zeros
 from comet import download_model, load_from_checkpoint
+from cache import SQLiteCache, make_key
+from profiling import count, timed
+from phonemes import phonemize_line, phonemize_poem, phonemize_poems
 
-# method to extract the sequence of stress values (primary stress = 1.0, secondary stress = 0.9, unstressed = 0.8)
-# from a line of English or German text
-def get_stresses(line, lang="de"):
-    # define the monophthongs, diphthongs, and triphthongs occurring
-    if lang == "de":
-        diphthongs = ["aɪ", "ɔø", "aʊ", "??"]
-        triphthongs = []
-        vowels = ["a", "e", "i", "o", "u", "y", "ø", "ɪ", "ɔ", "ʊ", "ɑ", "ɜ", "ɛ", "ə", "œ"]
-        text = phonemizer.phonemize(line, language="de", with_stress=True)
-    else: # for English
-        diphthongs = ["aɪ", "oʊ", "aʊ", "eɪ", "iɪ", "ɔɪ", "iə", "n̩", "l̩"]
-        triphthongs = ["aɪɚ", "aʊɚ"]
-        vowels = ["ʌ", "ɛ", "ə", "i", "ɚ", "ɪ", "æ", "u", "ʊ", "ᵻ", "ɐ", "ɑ", "ɜ", "ɔ", "o"]
-        text = phonemizer.phonemize(line, with_stress=True)
-    t = text
+# versions of the metrics, which are stored with the results (increase the version of a metric when changing its code,
+# so that evaluate_translations.py recomputes the stored results of this metric)
+METRIC_VERSIONS = {"cometkiwi": "1", "metrical_distance": "1", "rhyme_scheme_similarity": "1"}
+
+# the monophthongs, diphthongs, and triphthongs occurring in the transcriptions of each language (English for all
+# languages other than German)
+STRESS_SYMBOLS = {"de": {"diphthongs": ["aɪ", "ɔø", "aʊ", "??"],
+                         "triphthongs": [],
+                         "vowels": ["a", "e", "i", "o", "u", "y", "ø", "ɪ", "ɔ", "ʊ", "ɑ", "ɜ", "ɛ", "ə", "œ"]},
+                  "en": {"diphthongs": ["aɪ", "oʊ", "aʊ", "eɪ", "iɪ", "ɔɪ", "iə", "n̩", "l̩"],
+                         "triphthongs": ["aɪɚ", "aʊɚ"],
+                         "vowels": ["ʌ", "ɛ", "ə", "i", "ɚ", "ɪ", "æ", "u", "ʊ", "ᵻ", "ɐ", "ɑ", "ɜ", "ɔ", "o"]}}
+
+# tokenizer of the transcriptions of each language, compiled once: finds the stress marks and the vowels, from left to
+# right, preferring triphthongs over diphthongs over monophthongs at each position (i.e. longest match)
+stress_tokenizers = {lang: re.compile("|".join(re.escape(symbol) for symbol in
+                                               ["ˈ", "ˌ"] + symbols["triphthongs"] + symbols["diphthongs"] +
+                                               symbols["vowels"]))
+                     for lang, symbols in STRESS_SYMBOLS.items()}
+
+# get the stress values of a transcription in one pass over its tokens: a stress mark sets the stress value, a vowel
+# appends it to the sequence and resets it
+def get_transcription_stresses(transcription, tokenizer):
     sequence = []
     stress = 0.8
-    # go through the whole line
-    # for each character:
-    # - if it is a stress mark, change the stress value
-    # - if the beginning of the string is a vowel, append the stress value to the sequence and reset the stress value
-    while len(t) > 0:
-        if t[0] == "ˈ":
+    for token in tokenizer.findall(transcription):
+        if token == "ˈ":
             stress = 1
-        elif t[0] == "ˌ":
+        elif token == "ˌ":
             stress = 0.9
-        elif len(t) > 2 and t[:3] in triphthongs:
-            sequence.append(stress)
-            stress = 0.8
-            t = t[2:]
-        elif len(t) > 1 and t[:2] in diphthongs:
-            sequence.append(stress)
-            stress = 0.8
-            t = t[1:]
-        elif t[0] in vowels:
+        else:
             sequence.append(stress)
             stress = 0.8
-        t = t[1:]
     return sequence
 
+# method to extract the sequence of stress values (primary stress = 1.0, secondary stress = 0.9, unstressed = 0.8)
+# from a line of English or German text
+# (a precomputed transcription of the line, e.g. from phonemes.phonemize_poems, can be passed to skip phonemization)
+def get_stresses(line, lang="de", transcription=None):
+    if transcription is None:
+        transcription = phonemize_line(line, lang=lang)
+    return get_transcription_stresses(transcription, stress_tokenizers["de" if lang == "de" else "en"])
+
+# get the stress values of many transcriptions (e.g. of all lines of a corpus)
+def get_stresses_batch(transcriptions, lang="de"):
+    tokenizer = stress_tokenizers["de" if lang == "de" else "en"]
+    return [get_transcription_stresses(transcription, tokenizer) for transcription in transcriptions]
+
 # edit distance algorithm, where line and metre are represented as sequences of stress values
 # returns the alignment and the score for this line
 # set adjusted=True to adjust the distance based on the length of the metre (may be useful when lines of different
@@ -49,33 +61,35 @@ def get_stresses(line, lang="de"):
 def edit_distance_alignment(line, metre, adjusted=False):
     l = [0] + line
     m = [0] + metre
-    value_table = ndarray((len(l), len(m)))
-    pointer_table = ndarray((len(l), len(m)))
+    # the first column and row only allow insertions and deletions respectively (cumulative sums of the stresses)
+    value_table = [[0.0] * len(m) for i in range(len(l))]
+    pointer_table = [[0] * len(m) for i in range(len(l))]
+    total = 0
     for i in range(len(l)):
-        value_table[i][0] = sum(l[0:i + 1])
+        total += l[i]
+        value_table[i][0] = float(total)
         pointer_table[i][0] = 2  # 2 signifies insertion
+    total = 0
     for j in range(len(m)):
-        value_table[0][j] = sum(m[0:j + 1])
+        total += m[j]
+        value_table[0][j] = float(total)
         pointer_table[0][j] = 1  # 1 signifies deletion
-    for i in range(len(l)):
-        if i == 0:
-            pass
-        else:
-            for j in range(len(m)):
-                if j == 0:
-                    pass
-                else:
-                    insert = value_table[i - 1][j] + l[i]
-                    delete = value_table[i][j - 1] + m[j]
-                    substitute = value_table[i - 1][j - 1] + abs(
-                        l[i] - m[j])
-                    value_table[i][j] = min(insert, delete, substitute)
-                    if delete < insert and delete < substitute:
-                        pointer_table[i][j] = 1
-                    elif insert < substitute:
-                        pointer_table[i][j] = 2
-                    else:
-                        pointer_table[i][j] = 0  # 0 signifies substitution
+    for i in range(1, len(l)):
+        previous_row = value_table[i - 1]
+        row = value_table[i]
+        pointers = pointer_table[i]
+        l_i = l[i]
+        for j in range(1, len(m)):
+            insert = previous_row[j] + l_i
+            delete = row[j - 1] + m[j]
+            substitute = previous_row[j - 1] + abs(l_i - m[j])
+            row[j] = min(insert, delete, substitute)
+            if delete < insert and delete < substitute:
+                pointers[j] = 1
+            elif insert < substitute:
+                pointers[j] = 2
+            else:
+                pointers[j] = 0  # 0 signifies substitution
     score = value_table[-1][-1]
 
     # backtrack, recording for each metrical position in the reference how it is realized in the actual line
@@ -85,42 +99,117 @@ def edit_distance_alignment(line, metre, adjusted=False):
     while j >= 0 and i >= 0:
         internal = []
         while pointer_table[i][j] == 2:
-            internal = [l[i]] + internal
+            internal.append(l[i])
             i -= 1
         if pointer_table[i][j] == 0:
-            internal = [l[i]] + internal
+            internal.append(l[i])
             i -= 1
             j -= 1
         elif pointer_table[i][j] == 1:
-            internal = [0] + internal
+            internal.append(0)
             j -= 1
-        alignment = [internal] + alignment
+        internal.reverse()
+        alignment.append(internal)
+    alignment.reverse()
     if adjusted:
         return alignment, (score*10)/len(metre) # adjust for reference metre length
     else:
         return alignment, score
 
+# minimum length of line and metre from which the score is computed along anti-diagonals with numpy
+# (below that, the overhead of the numpy calls outweighs the vectorization)
+WAVEFRONT_MIN_LENGTH = 96
+
+# score-only variant of edit_distance_alignment (same score, but without pointer table and backtracking)
+def edit_distance(line, metre, adjusted=False):
+    if len(line) >= WAVEFRONT_MIN_LENGTH and len(metre) >= WAVEFRONT_MIN_LENGTH:
+        score = edit_distance_wavefront(line, metre)
+    else:
+        # only keep the previous row of the value table
+        previous_row = [0.0] * (len(metre) + 1)
+        total = 0
+        for j in range(len(metre)):
+            total += metre[j]
+            previous_row[j + 1] = float(total)
+        total = 0
+        for l_i in line:
+            total += l_i
+            left = float(total)
+            row = [left]
+            for j in range(len(metre)):
+                m_j = metre[j]
+                left = min(previous_row[j + 1] + l_i, left + m_j, previous_row[j] + abs(l_i - m_j))
+                row.append(left)
+            previous_row = row
+        score = previous_row[-1]
+    if adjusted:
+        return (score*10)/len(metre) # adjust for reference metre length
+    return score
+
+# compute the edit distance score along the anti-diagonals of the value table, where all cells only depend on the
+# previous two anti-diagonals and can therefore be computed at once (with the same operations as in the loop)
+def edit_distance_wavefront(line, metre):
+    l = array([0] + line, dtype=float)
+    m = array([0] + metre, dtype=float)
+    value_table = empty((len(l), len(m)))
+    value_table[:, 0] = cumsum(l)
+    value_table[0, :] = cumsum(m)
+    for d in range(2, len(l) + len(m) - 1):
+        i = arange(max(1, d - len(m) + 1), min(len(l) - 1, d - 1) + 1)
+        j = d - i
+        value_table[i, j] = minimum(minimum(value_table[i - 1, j] + l[i], value_table[i, j - 1] + m[j]),
+                                    value_table[i - 1, j - 1] + abs(l[i] - m[j]))
+    return float(value_table[-1, -1])
+
 # get a list of metrical distances for each of several lines
 def line_distance(stresses, metre):
-    return [edit_distance_alignment(stresses[i], metre[i])[1] for i in range(len(stresses))]
+    return [edit_distance(stresses[i], metre[i]) for i in range(len(stresses))]
 
-# get the metrical distance for a whole poem
-def get_metrical_distance(candidate, metrical_pattern, lang="de"):
-    # if the candidate is a text, get stress values first
+# score-only edit distance for many pairs of lines and metres at once, as a dynamic program over a 3-D tensor
+# (pair x line position x metre position) that is filled along the anti-diagonals
+# the pairs are sorted by length and processed in batches of batch_size, which limits padding and memory
+@timed("edit_distance_batch")
+def edit_distance_batch(lines, metres, batch_size=4096):
+    order = sorted(range(len(lines)), key=lambda p: (len(lines[p]), len(metres[p])))
+    scores = [0.0] * len(lines)
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        line_lengths = array([len(lines[p]) for p in batch], dtype=int)
+        metre_lengths = array([len(metres[p]) for p in batch], dtype=int)
+        # pad all sequences with zeros (padded cells never influence the cells within the actual lengths)
+        l = zeros((len(batch), line_lengths.max() + 1))
+        m = zeros((len(batch), metre_lengths.max() + 1))
+        for row in range(len(batch)):
+            l[row, 1:line_lengths[row] + 1] = lines[batch[row]]
+            m[row, 1:metre_lengths[row] + 1] = metres[batch[row]]
+        value_table = empty((len(batch), l.shape[1], m.shape[1]))
+        value_table[:, :, 0] = cumsum(l, axis=1)
+        value_table[:, 0, :] = cumsum(m, axis=1)
+        for d in range(2, l.shape[1] + m.shape[1] - 1):
+            i = arange(max(1, d - m.shape[1] + 1), min(l.shape[1] - 1, d - 1) + 1)
+            j = d - i
+            value_table[:, i, j] = minimum(minimum(value_table[:, i - 1, j] + l[:, i], value_table[:, i, j - 1] + m[:, j]),
+                                           value_table[:, i - 1, j - 1] + abs(l[:, i] - m[:, j]))
+        batch_scores = value_table[arange(len(batch)), line_lengths, metre_lengths].tolist()
+        for row in range(len(batch)):
+            scores[batch[row]] = batch_scores[row]
+    return scores
+
+# get the stress values of all (non-empty) lines of a poem
+# (candidate: a text or a list of stress values, which is returned as a copy)
+def get_poem_stresses(candidate, lang="de", transcriptions=None):
     if type(candidate) is str:
-        stresses = [get_stresses(line=line, lang=lang) for line in candidate.split("\n")]
-        stresses = [x for x in stresses if x != []]
-    else:
-        stresses = candidate.copy()
+        if transcriptions is None:
+            transcriptions = phonemize_poem(candidate, lang=lang)
+        return [x for x in get_stresses_batch(transcriptions, lang=lang) if x != []]
+    return candidate.copy()
 
-    metre = metrical_pattern.copy()
+# if the candidate and the metre are of different length, remove lines iteratively (always the one with the lowest
+# total stress) from the longer one
+# returns the remaining stresses and metre and the total stress of the removed lines
+def remove_lines(stresses, metre):
     total = 0
-
-    # undefined if there is no poem (e.g. because none has been produced)
-    if len(stresses) == 0 or len(metre) == 0:
-        return None
-    # if the two parts are of different length, remove lines iteratively
-    elif len(stresses) > len(metre):
+    if len(stresses) > len(metre):
         diff = len(stresses) - len(metre)
         while diff > 0:
             min_value = 1000
@@ -144,82 +233,250 @@ def get_metrical_distance(candidate, metrical_pattern, lang="de"):
                     min_index = x
             total += sum(metre.pop(min_index))
             diff -= 1
+    return stresses, metre, total
+
+# get the metrical distance for a whole poem
+# (transcriptions: optional precomputed transcriptions, one for each line in candidate.split("\n"))
+@timed("metrical_distance")
+def get_metrical_distance(candidate, metrical_pattern, lang="de", transcriptions=None):
+    # if the candidate is a text, get stress values first
+    stresses = get_poem_stresses(candidate, lang=lang, transcriptions=transcriptions)
+    metre = metrical_pattern.copy()
+
+    # undefined if there is no poem (e.g. because none has been produced)
+    if len(stresses) == 0 or len(metre) == 0:
+        return None
+    # if the two parts are of different length, remove lines iteratively
+    stresses, metre, total = remove_lines(stresses, metre)
 
     # return average line distance
     return (total + sum(line_distance(stresses, metre))) / len(metre)
 
-# get the rhyme scheme similarity between a candidate (as a text) and a reference (as a list of rhyme pairs)
-def get_rhyme_scheme_similarity(candidate, rhyme_scheme, lang="de"):
-    # get the phonetic sequence from the last stressed vowel onwards and the preceding consonantal onset
-    def get_rhyme(line, lang=lang):
-        if lang == "de":
-            transcription = phonemizer.phonemize(line, language="de", with_stress=True)
-            # replace vowels according to the equivalence rules
-            equivalences = [("y", "i"), ("ɪ", "i"), ("ɔø", "aɪ"), ("ai", "aɪ"), ("aʊ", "aw"), ("ø", "e"), ("œ", "e"),
-                            ("ɛ", "e"), ("ɑ", "a"), ("ɔ", "o"), ("ʊ", "u"),
-                            ("ː", "")]
-            for e in equivalences:
-                transcription = transcription.replace(e[0], e[1])  # remove umlaut and length distinctions
-            transcription = transcription.replace("ˌ", "ˈ")
-            index = transcription.rfind("ˈ")
-            rhyme = transcription[index+1:]
-            # define all possible onsets
-            onset = transcription[index-3:index] if transcription[index-3:index] in ["ʃtɾ", "ʃpɾ", "tsv"] else \
-                transcription[index-2:index] if transcription[index-2:index] in ["ʃl", "ʃm", "ʃn", "ʃɾ", "ʃv", "bɾ",
-                                                                                 "bl", "dɾ", "fɾ", "fl", "ɡɾ", "ɡl",
-                                                                                 "ɡn", "kl", "kɾ", "kn", "pl", "pɾ",
-                                                                                 "pn", "kv", "ʃt", "ʃp", "tɾ", "vɾ",
-                                                                                 "ts", "pf", "ps", "ks"] else \
-                transcription[index-1:index]
-        else: # English
-            transcription = phonemizer.phonemize(line, with_stress=True)
-            transcription = transcription.replace("ˌ", "ˈ")
-            index = transcription.rfind("ˈ")
-            rhyme = transcription[index+1:]
-            # define all possible onsets
-            onset = transcription[index-3:index] if transcription[index-3:index] in ["stɹ", "spɹ"] else \
-                transcription[index-2:index] if transcription[index-2:index] in ["pl", "pɹ", "bl", "bɹ", "fl", "fɹ",
-                                                                                 "tɹ", "dɹ", "ʃɾ", "sl", "tʃ", "dʒ",
-                                                                                 "sw", "kw", "kɹ", "kl", "gl", "gɹ",
-                                                                                 "ks"] else \
-                transcription[index-1:index]
-
-        return rhyme, onset
-
-    # get a list of rhyme pairs
-    def get_rhyme_scheme(candidate, lang=lang):
-        rhymes = [get_rhyme(line, lang=lang) for line in candidate.split("\n") if line.strip() != ""]
-        pairs = []
-        for i in range(len(rhymes)):
-            for j in range(len(rhymes)-i-1):
-                if rhymes[i][0]==rhymes[j+i+1][0] and rhymes[i][1]!=rhymes[j+i+1][1]:
-                    pairs.append([i,j+i+1])
-                elif (rhymes[i][0].endswith(rhymes[j+i+1][0]) or rhymes[j+i+1][0].endswith(rhymes[i][0])) and \
-                        rhymes[i][1]!=rhymes[j+i+1][1] and not \
-                        rhymes[i][0].endswith(rhymes[j+i+1][1]+rhymes[j+i+1][0]) and not \
-                        rhymes[j+i+1][1].endswith(rhymes[i][1]+rhymes[i][0]):
-                    pairs.append([i,j+i+1])
-        return pairs
+# get the metrical distances for a whole corpus of poems (e.g. all poems of a condition file) in one call
+# gives the same results as calling get_metrical_distance for each poem, but phonemizes all texts in one batch
+# and computes the edit distances of all line pairs at once with edit_distance_batch
+# (transcriptions: optional precomputed transcriptions for each poem, as returned by phonemes.phonemize_poems)
+@timed("metrical_distance_batch")
+def get_metrical_distance_batch(candidates, metrical_patterns, lang="de", transcriptions=None):
+    if transcriptions is None:
+        texts = [c for c in candidates if type(c) is str]
+        text_transcriptions = iter(phonemize_poems(texts, lang=lang))
+        transcriptions = [next(text_transcriptions) if type(c) is str else None for c in candidates]
+
+    # collect the line pairs of all poems
+    lines = []
+    metres = []
+    poems = []  # for each poem: (index of its first line pair, number of line pairs, total of removed lines)
+    for p in range(len(candidates)):
+        stresses = get_poem_stresses(candidates[p], lang=lang, transcriptions=transcriptions[p])
+        metre = metrical_patterns[p].copy()
+        if len(stresses) == 0 or len(metre) == 0:
+            poems.append(None)
+            continue
+        stresses, metre, total = remove_lines(stresses, metre)
+        poems.append((len(lines), len(metre), total))
+        lines += stresses
+        metres += metre
+
+    count("edit_distance_pairs", len(lines))
+    scores = edit_distance_batch(lines, metres)
+    distances = []
+    for poem in poems:
+        if poem is None:
+            distances.append(None)
+        else:
+            start, length, total = poem
+            distances.append((total + sum(scores[start:start + length])) / length)
+    return distances
+
+# the equivalence rules of each language, applied in this order (for German, vowels are replaced to remove umlaut and
+# length distinctions; for both languages, secondary stress marks are treated as primary ones)
+RHYME_EQUIVALENCES = {"de": [("y", "i"), ("ɪ", "i"), ("ɔø", "aɪ"), ("ai", "aɪ"), ("aʊ", "aw"), ("ø", "e"),
+                             ("œ", "e"), ("ɛ", "e"), ("ɑ", "a"), ("ɔ", "o"), ("ʊ", "u"), ("ː", ""), ("ˌ", "ˈ")],
+                      "en": [("ˌ", "ˈ")]}
+# all possible onsets of three and of two symbols
+RHYME_ONSETS = {"de": (frozenset(["ʃtɾ", "ʃpɾ", "tsv"]),
+                       frozenset(["ʃl", "ʃm", "ʃn", "ʃɾ", "ʃv", "bɾ", "bl", "dɾ", "fɾ", "fl", "ɡɾ", "ɡl", "ɡn", "kl",
+                                  "kɾ", "kn", "pl", "pɾ", "pn", "kv", "ʃt", "ʃp", "tɾ", "vɾ", "ts", "pf", "ps",
+                                  "ks"])),
+                "en": (frozenset(["stɹ", "spɹ"]),
+                       frozenset(["pl", "pɹ", "bl", "bɹ", "fl", "fɹ", "tɹ", "dɹ", "ʃɾ", "sl", "tʃ", "dʒ", "sw", "kw",
+                                  "kɹ", "kl", "gl", "gɹ", "ks"]))}
+
+# apply the equivalence rules of a language to a transcription (or to many transcriptions joined by line breaks, as
+# none of the rules involves a line break)
+def normalize_transcription(transcription, lang="de"):
+    for e in RHYME_EQUIVALENCES["de" if lang == "de" else "en"]:
+        transcription = transcription.replace(e[0], e[1])
+    return transcription
+
+# get the rhyme and the onset from a normalized transcription
+def split_rhyme(transcription, onsets):
+    index = transcription.rfind("ˈ")
+    rhyme = transcription[index+1:]
+    onset = transcription[index-3:index] if transcription[index-3:index] in onsets[0] else \
+        transcription[index-2:index] if transcription[index-2:index] in onsets[1] else \
+        transcription[index-1:index]
+    return rhyme, onset
+
+# get the phonetic sequence from the last stressed vowel onwards and the preceding consonantal onset
+# (a precomputed transcription of the line can be passed to skip phonemization)
+def get_rhyme(line, lang="de", transcription=None):
+    if transcription is None:
+        transcription = phonemize_line(line, lang=lang)
+    return split_rhyme(normalize_transcription(transcription, lang=lang), RHYME_ONSETS["de" if lang == "de" else "en"])
+
+# get the (rhyme, onset) pairs of many transcriptions, normalizing all of them in one pass over their joined text
+def get_rhyme_batch(transcriptions, lang="de"):
+    onsets = RHYME_ONSETS["de" if lang == "de" else "en"]
+    if len(transcriptions) == 0 or any("\n" in transcription for transcription in transcriptions):
+        return [get_rhyme(None, lang=lang, transcription=transcription) for transcription in transcriptions]
+    return [split_rhyme(transcription, onsets)
+            for transcription in normalize_transcription("\n".join(transcriptions), lang=lang).split("\n")]
+
+# check whether line i and line j > i rhyme, given their (rhyme, onset) pairs
+def is_rhyme_pair(rhyme_i, rhyme_j):
+    if rhyme_i[0]==rhyme_j[0] and rhyme_i[1]!=rhyme_j[1]:
+        return True
+    return (rhyme_i[0].endswith(rhyme_j[0]) or rhyme_j[0].endswith(rhyme_i[0])) and \
+        rhyme_i[1]!=rhyme_j[1] and not \
+        rhyme_i[0].endswith(rhyme_j[1]+rhyme_j[0]) and not \
+        rhyme_j[1].endswith(rhyme_i[1]+rhyme_i[0])
+
+# minimum number of lines from which the rhyme pairs are found with an index of the rhymes (below that, e.g. for
+# sonnets, comparing all pairs of lines is faster than building the index)
+RHYME_INDEX_MIN_LINES = 20
+
+# get the pairs of rhyming lines from the (rhyme, onset) pairs of the lines
+# two lines can only rhyme if the rhyme of one of them ends with the rhyme of the other, so instead of comparing all
+# pairs of lines, the lines of long poems are indexed by their rhyme and each line is only compared to the lines whose
+# rhyme is a suffix of its own rhyme (the result is the same as for the comparison of all pairs, ordered by i and j)
+def get_rhyme_pairs(rhymes):
+    if len(rhymes) < RHYME_INDEX_MIN_LINES:
+        return [[i, j] for i in range(len(rhymes)) for j in range(i + 1, len(rhymes))
+                if is_rhyme_pair(rhymes[i], rhymes[j])]
+    index = {}
+    for i in range(len(rhymes)):
+        index.setdefault(rhymes[i][0], []).append(i)
+    pairs = set()
+    for i in range(len(rhymes)):
+        rhyme = rhymes[i][0]
+        for start in range(len(rhyme) + 1):
+            for j in index.get(rhyme[start:], []):
+                if j != i:
+                    pair = (i, j) if i < j else (j, i)
+                    if pair not in pairs and is_rhyme_pair(rhymes[pair[0]], rhymes[pair[1]]):
+                        pairs.add(pair)
+    return [[i, j] for i, j in sorted(pairs)]
 
+# get a list of rhyme pairs
+# (candidate: a text, or the (rhyme, onset) pairs of its non-empty lines, e.g. from the feature index;
+# transcriptions: optional precomputed transcriptions, one for each line in candidate.split("\n"))
+def get_rhyme_scheme(candidate, lang="de", transcriptions=None):
+    # if the candidate is a text, get the rhymes first
+    if type(candidate) is not str:
+        return get_rhyme_pairs(candidate)
+    lines = candidate.split("\n")
+    if transcriptions is None:
+        transcriptions = phonemize_poem(candidate, lang=lang)
+    rhymes = get_rhyme_batch([transcriptions[i] for i in range(len(lines)) if lines[i].strip() != ""], lang=lang)
+    return get_rhyme_pairs(rhymes)
+
+# get the rhyme scheme similarity between a candidate (as a text or as the (rhyme, onset) pairs of its non-empty lines)
+# and a reference (as a list of rhyme pairs)
+# (transcriptions: optional precomputed transcriptions, one for each line in candidate.split("\n"))
+@timed("rhyme_scheme_similarity")
+def get_rhyme_scheme_similarity(candidate, rhyme_scheme, lang="de", transcriptions=None):
     # calculate rhyme scheme similarity from the overlap between the rhyme pairs of candidate and reference
-    candidate_rhyme_scheme = get_rhyme_scheme(candidate=candidate, lang=lang)
+    candidate_rhyme_scheme = get_rhyme_scheme(candidate=candidate, lang=lang, transcriptions=transcriptions)
+    candidate_pairs = set((e[0], e[1]) for e in candidate_rhyme_scheme)
+    reference_pairs = set((e[0], e[1]) for e in rhyme_scheme)
     f1_score = 0
     if len(candidate_rhyme_scheme) > 0:
-        precision = len([e for e in candidate_rhyme_scheme if e in rhyme_scheme]) / len(candidate_rhyme_scheme)
+        precision = len([e for e in candidate_rhyme_scheme if (e[0], e[1]) in reference_pairs]) / \
+                    len(candidate_rhyme_scheme)
     else:
         precision = 1.0
     if len(rhyme_scheme) > 0:
-        recall = len([e for e in rhyme_scheme if e in candidate_rhyme_scheme]) / len(rhyme_scheme)
+        recall = len([e for e in rhyme_scheme if (e[0], e[1]) in candidate_pairs]) / len(rhyme_scheme)
     else:
         recall = 1.0
     if precision + recall > 0:
         f1_score = 2 * precision * recall / (precision + recall)
     return precision, recall, f1_score
 
+# identity of the CometKiwi model for the cache keys: the model name, or for a local checkpoint its absolute path and
+# modification time (so that the scores of another checkpoint, or of the checkpoint before it changed, are not reused)
+def get_model_id(model, checkpoint_path=None):
+    if checkpoint_path is None:
+        return model
+    path = os.path.abspath(checkpoint_path)
+    return f"{path}:{os.path.getmtime(path)}" if os.path.exists(path) else path
+
+# CometKiwi scorer that loads the model only once and keeps it for all subsequent calls
+# - checkpoint_path: path to a local model checkpoint (e.g. .../checkpoints/model.ckpt) for machines without network
+#   access (in this case, the encoder and tokenizer are also only looked up locally)
+# - batch_size, gpus, num_workers: passed on to model.predict (gpus=0 for inference on the CPU)
+# - cache_path: location of the on-disk cache of scores, keyed by (model or checkpoint, src, mt), or None to disable
+#   caching
+class CometKiwiScorer:
+    def __init__(self, model="Unbabel/wmt22-cometkiwi-da", checkpoint_path=None, batch_size=16, gpus=1,
+                 num_workers=None, cache_path=os.path.join("cache", "cometkiwi.sqlite"), cache_max_entries=1000000):
+        self.model_name = model
+        self.checkpoint_path = checkpoint_path
+        self.model_id = get_model_id(model, checkpoint_path)
+        self.batch_size = batch_size
+        self.gpus = gpus
+        self.num_workers = num_workers
+        self.cache = SQLiteCache(cache_path, table="scores", max_entries=cache_max_entries) \
+            if cache_path is not None else None
+        self.model = None
+
+    # load the model (only on first use)
+    def load(self):
+        if self.model is None:
+            with timed("cometkiwi_load"):
+                if self.checkpoint_path is not None:
+                    self.model = load_from_checkpoint(self.checkpoint_path, local_files_only=True)
+                else:
+                    self.model = load_from_checkpoint(download_model(self.model_name))
+        return self.model
+
+    # get the scores for a list of originals and their translations
+    # pairs found in the cache are not scored again, the others are sorted by length to reduce padding
+    def score(self, originals, translations):
+        keys = [make_key(self.model_id, originals[i], translations[i]) for i in range(len(originals))]
+        scores = self.cache.get(keys) if self.cache is not None else {}
+        missing = {}
+        for i in range(len(keys)):
+            if keys[i] not in scores and keys[i] not in missing:
+                missing[keys[i]] = i
+        if self.cache is not None:
+            hits = len([key for key in keys if key in scores])
+            count("cometkiwi_cache_hits", hits)
+            count("cometkiwi_cache_misses", len(keys) - hits)
+        if len(missing) > 0:
+            order = sorted(missing.values(), key=lambda i: len(originals[i]) + len(translations[i]))
+            data = [{"src": originals[i], "mt": translations[i]} for i in order]
+            model = self.load()
+            with timed("cometkiwi_inference"):
+                model_output = model.predict(data, batch_size=self.batch_size, gpus=self.gpus,
+                                             num_workers=self.num_workers, length_batching=False)
+            count("cometkiwi_scored", len(order))
+            new_scores = {keys[order[n]]: model_output.scores[n] for n in range(len(order))}
+            if self.cache is not None:
+                self.cache.put(new_scores)
+            scores.update(new_scores)
+        return [scores[key] for key in keys]
+
+cometkiwi_scorer = None
+
 # get cometkiwi scores
-def get_cometkiwi(originals, translations):
-    model_path = download_model("Unbabel/wmt22-cometkiwi-da")
-    model = load_from_checkpoint(model_path)
-    data = [{"src": originals[i], "mt": translations[i]} for i in range(len(originals))]
-    model_output = model.predict(data)
-    return model_output.scores
+# (with the shared default scorer, so that the model is only loaded once, unless another scorer is given)
+def get_cometkiwi(originals, translations, scorer=None):
+    global cometkiwi_scorer
+    if scorer is None:
+        if cometkiwi_scorer is None:
+            cometkiwi_scorer = CometKiwiScorer()
+        scorer = cometkiwi_scorer
+    return scorer.score(originals, translations)
@@ -0,0 +1,115 @@
+import os
+import phonemizer
+from cache import SQLiteCache, make_key
+from profiling import count, timed
+from phonemizer.backend import EspeakBackend
+from phonemizer.separator import default_separator
+
+# persistent espeak backends (one per language), so that the backend is only set up once per process
+backends = {}
+
+# location of the on-disk transcription cache (set to None to disable caching)
+cache_path = os.path.join("cache", "transcriptions.sqlite")
+# maximum number of transcriptions kept in the cache (the least recently used ones are evicted first)
+cache_max_entries = 1000000
+
+# get the espeak language code for a language ("de" for German, anything else for English)
+def get_language(lang="de"):
+    return "de" if lang == "de" else "en-us"
+
+# get the espeak backend for a language, setting it up only once
+def get_backend(lang="de"):
+    language = get_language(lang)
+    if language not in backends:
+        with timed("espeak_setup"):
+            backends[language] = EspeakBackend(language, with_stress=True)
+    return backends[language]
+
+version = None
+
+# get the versions of phonemizer and espeak, on which the transcriptions depend
+def get_version():
+    global version
+    if version is None:
+        version = f"phonemizer-{phonemizer.__version__}/espeak-" + ".".join(str(v) for v in EspeakBackend.version())
+    return version
+
+# on-disk cache of transcriptions, keyed by (line, language, phonemizer and espeak version)
+class TranscriptionCache(SQLiteCache):
+    def __init__(self, path, max_entries=1000000):
+        super().__init__(path, table="transcriptions", max_entries=max_entries)
+
+    # look up a list of lines; returns a dictionary from line to transcription for all lines found in the cache
+    def get_transcriptions(self, lines, language):
+        keys = {line: make_key(get_version(), language, line) for line in set(lines)}
+        found = self.get([keys[line] for line in lines])
+        return {line: found[keys[line]] for line in keys if keys[line] in found}
+
+    # store transcriptions (given as a dictionary from line to transcription)
+    def put_transcriptions(self, transcriptions, language):
+        self.put({make_key(get_version(), language, line): transcriptions[line] for line in transcriptions})
+
+cache = None
+
+# get the transcription cache (None if caching is disabled)
+def get_cache():
+    global cache
+    if cache_path is None:
+        return None
+    if cache is None or cache.path != cache_path:
+        cache = TranscriptionCache(cache_path, max_entries=cache_max_entries)
+    return cache
+
+# phonemize a list of lines in a single batched call
+# the output is the same as calling phonemizer.phonemize(line, with_stress=True) on each line separately
+# (in particular, empty lines are transcribed as "")
+# lines found in the transcription cache are not phonemized again
+def phonemize_lines(lines, lang="de"):
+    lines = [line.strip("\n") for line in lines]
+    indices = [i for i in range(len(lines)) if lines[i].strip() != ""]
+    transcriptions = [""] * len(lines)
+    if len(indices) == 0:
+        return transcriptions
+    language = get_language(lang)
+    transcription_cache = get_cache()
+    found = {}
+    if transcription_cache is not None:
+        with timed("transcription_cache_get"):
+            found = transcription_cache.get_transcriptions([lines[i] for i in indices], language)
+        hits = len([i for i in indices if lines[i] in found])
+        count("transcription_cache_hits", hits)
+        count("transcription_cache_misses", len(indices) - hits)
+    missing = list(dict.fromkeys(lines[i] for i in indices if lines[i] not in found))
+    if len(missing) > 0:
+        backend = get_backend(lang)
+        with timed("phonemize"):
+            phonemized = backend.phonemize(missing, separator=default_separator, strip=False)
+        count("phonemized_lines", len(missing))
+        new = {missing[i]: phonemized[i] for i in range(len(missing))}
+        if transcription_cache is not None:
+            with timed("transcription_cache_put"):
+                transcription_cache.put_transcriptions(new, language)
+        found.update(new)
+    for i in indices:
+        transcriptions[i] = found[lines[i]]
+    return transcriptions
+
+# phonemize a single line
+def phonemize_line(line, lang="de"):
+    return phonemize_lines([line], lang=lang)[0]
+
+# phonemize a poem, returning one transcription for each line in poem.split("\n")
+def phonemize_poem(poem, lang="de"):
+    return phonemize_lines(poem.split("\n"), lang=lang)
+
+# phonemize a whole corpus (e.g. all poems of a condition file) in a single batched call,
+# returning a list of transcriptions (one per line in poem.split("\n")) for each poem
+def phonemize_poems(poems, lang="de"):
+    lines = [poem.split("\n") for poem in poems]
+    transcriptions = phonemize_lines([line for poem in lines for line in poem], lang=lang)
+    result = []
+    start = 0
+    for poem in lines:
+        result.append(transcriptions[start:start + len(poem)])
+        start += len(poem)
+    return result
@@ -0,0 +1,157 @@
+import os
+import re
+import asyncio
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from corpus import ORIGINALS, REFERENCE_METRES, REFERENCE_RHYME_SCHEMES
+from corpus import read_metres, read_poems, read_rhyme_schemes
+from evaluate_translations import evaluate_shard, get_form_hashes, init_worker
+from get_translations import CONDITIONS, add_request_arguments, configure, write_translations
+from profiling import merge_stats, write_report
+from results_store import ResultsStore
+
+# closed loop of generation and evaluation: the poems go through one or more rounds of conditions (e.g. plainform,
+# then iterativeform twice), and each translation is scored (metrical distance and rhyme scheme similarity) on a pool
+# of worker processes as soon as it has been generated, while the requests for the other poems are still running.
+# In the rounds after the first, a poem is only prompted again if its translation from the previous round misses the
+# thresholds (metrical distance above threshold or rhyme scheme similarity below min_rhyme); otherwise the translation
+# is carried over. The translations of each round are written to <output_dir>/<tag> and the scores are saved in the
+# results store (with the same input hashes as evaluate_translations.py, which then only computes CometKiwi for them)
+# usage: python pipeline.py --rounds plainform iterativeform iterativeform --model gpt-4o --threshold 0.5
+
+# get the tags of the rounds (e.g. gpt4o_loop1_plainform)
+def get_round_tags(prefix, rounds):
+    return [f"{prefix}_loop{r + 1}_{rounds[r]}" for r in range(len(rounds))]
+
+# the text of a translation as evaluate_translations.py reads it back from the file written by write_translations
+# (read_poems keeps the line breaks around each poem), so that the input hashes of the stored results match
+def get_written_text(translation):
+    return "\n" + str(translation) + "\n"
+
+# check whether a translation has to be prompted again, given its (metrical distance, rhyme scheme similarity)
+def needs_refinement(scores, threshold=None, min_rhyme=None):
+    if threshold is None and min_rhyme is None:
+        return True
+    metrical_distance, rhyme_scheme_similarity = scores
+    if metrical_distance is None:
+        return True
+    return (threshold is not None and metrical_distance > threshold) or \
+        (min_rhyme is not None and rhyme_scheme_similarity < min_rhyme)
+
+# run the rounds for all poems, with up to `concurrency` poems waiting on the API at the same time and the scoring on
+# `workers` processes; returns the translations and (metrical distance, rhyme scheme similarity) of each round and poem
+# (None for poems whose request or scoring failed) and the number of poems prompted in each round
+async def run_pipeline(rounds, tags, original_poems, metres, rhyme_schemes, model, store, seed_translations=None,
+                       threshold=None, min_rhyme=None, concurrency=8, workers=None, lang="de"):
+    loop = asyncio.get_running_loop()
+    api_executor = ThreadPoolExecutor(max_workers=concurrency)
+    score_executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(lang,))
+    translations = [[None] * len(original_poems) for r in rounds]
+    scores = [[None] * len(original_poems) for r in rounds]
+    prompted = [0] * len(rounds)
+
+    async def score(r, i, translation):
+        text = get_written_text(translation)
+        unit = (tags[r], i, text, metres[i], rhyme_schemes[i], lang) + \
+            get_form_hashes(text, metres[i], rhyme_schemes[i], lang)
+        results, stats = await loop.run_in_executor(score_executor, evaluate_shard, [unit])
+        merge_stats(stats)
+        return results
+
+    async def process(i):
+        attempt = seed_translations[i] if seed_translations is not None else None
+        results = None
+        for r in range(len(rounds)):
+            function, iterative = CONDITIONS[rounds[r]]
+            if r > 0 and not needs_refinement(scores[r - 1][i], threshold=threshold, min_rhyme=min_rhyme):
+                # carry the translation and its scores over to this round
+                translation = attempt
+                results = [(tags[r],) + entry[1:] for entry in results]
+            else:
+                inputs = (original_poems[i], attempt) if iterative else (original_poems[i],)
+                try:
+                    translation = await loop.run_in_executor(api_executor, partial(function, *inputs, model=model))
+                except Exception as e:
+                    print(f"poem {i + 1}, round {r + 1} ({rounds[r]}) failed: {e!r}")
+                    return
+                prompted[r] += 1
+                try:
+                    results = await score(r, i, translation)
+                except Exception as e:
+                    print(f"poem {i + 1}, round {r + 1} ({rounds[r]}) could not be scored: {e!r}")
+                    return
+            store.put(results)
+            values = {entry[2]: entry[5] for entry in results}
+            translations[r][i] = translation
+            scores[r][i] = (values["metrical_distance"], values["rhyme_scheme_similarity"])
+            attempt = translation
+
+    try:
+        await asyncio.gather(*[process(i) for i in range(len(original_poems))])
+    finally:
+        api_executor.shutdown()
+        score_executor.shutdown()
+    return translations, scores, prompted
+
+# mean of the values that are not None
+def get_mean(values):
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if len(values) > 0 else None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate translations in one or more rounds and score each "
+                                                 "translation as soon as it has been generated.")
+    parser.add_argument("--rounds", nargs="+", default=["plainform", "iterativeform"], choices=list(CONDITIONS),
+                        help="the conditions of the rounds (each round after the first improves upon the previous)")
+    parser.add_argument("--model", default="gpt-4o", help="the model name")
+    parser.add_argument("--data", default="data", help="directory with the originals and references")
+    parser.add_argument("--originals", default=None, help="file with the original poems (default: from --data)")
+    parser.add_argument("--seed", default=None,
+                        help="file with the previous attempts (if the first round improves upon a seed translation)")
+    parser.add_argument("--tag", default=None,
+                        help="prefix of the tags of the rounds (default: the model name without special characters)")
+    parser.add_argument("--output-dir", default="data", help="directory to write the translations of the rounds to")
+    parser.add_argument("--store", default="results.sqlite", help="results store (SQLite database)")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="only prompt a poem again if its metrical distance is above this threshold")
+    parser.add_argument("--min-rhyme", type=float, default=None,
+                        help="only prompt a poem again if its rhyme scheme similarity is below this value")
+    parser.add_argument("--concurrency", type=int, default=8, help="maximum number of poems waiting on the API")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes for scoring")
+    parser.add_argument("--lang", default="de", help="language of the translations")
+    parser.add_argument("--report", default=None, help="JSON file to write a report of the scoring stages to")
+    add_request_arguments(parser)
+    args = parser.parse_args()
+    configure(args)
+
+    original_poems = read_poems(args.originals or os.path.join(args.data, ORIGINALS))
+    metres = read_metres(os.path.join(args.data, REFERENCE_METRES))
+    rhyme_schemes = read_rhyme_schemes(os.path.join(args.data, REFERENCE_RHYME_SCHEMES))
+    seed_translations = None
+    if CONDITIONS[args.rounds[0]][1]:
+        if args.seed is None:
+            parser.error(f"the first round ({args.rounds[0]}) needs seed translations (--seed)")
+        seed_translations = read_poems(args.seed)
+    tags = get_round_tags(args.tag or re.sub("[^A-Za-z0-9]", "", args.model), args.rounds)
+    store = ResultsStore(args.store)
+
+    translations, scores, prompted = asyncio.run(run_pipeline(
+        args.rounds, tags, original_poems, metres, rhyme_schemes, args.model, store,
+        seed_translations=seed_translations, threshold=args.threshold, min_rhyme=args.min_rhyme,
+        concurrency=args.concurrency, workers=args.workers, lang=args.lang))
+    store.close()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for r in range(len(args.rounds)):
+        missing = [i + 1 for i in range(len(original_poems)) if translations[r][i] is None]
+        print(f"{tags[r]}: prompted {prompted[r]} poems, mean metrical distance "
+              f"{get_mean([s[0] for s in scores[r] if s is not None])}, mean rhyme scheme similarity "
+              f"{get_mean([s[1] for s in scores[r] if s is not None])}")
+        if len(missing) > 0:
+            print(f"{len(missing)} poems could not be translated or scored (rerun to resume from the response "
+                  f"cache): {missing}")
+        else:
+            write_translations(translations[r], os.path.join(args.output_dir, tags[r]))
+    if args.report is not None:
+        write_report(args.report, tags=tags, prompted=prompted)
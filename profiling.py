@@ -0,0 +1,105 @@
+import json
+import time
+import threading
+from functools import wraps
+
+# instrumentation of the evaluation pipeline: timers, counters and throughputs of the current process, which can be
+# collected from worker processes (take_stats), merged into the main process (merge_stats) and written as a JSON report
+
+timers = {} # name -> [number of calls, total seconds]
+counters = {} # name -> count (counters named <cache>_hits and <cache>_misses are reported as cache hit rates)
+throughputs = {} # name -> [number of items, total seconds]
+lock = threading.RLock()
+
+# add the time of one or more calls to a timer
+def add_time(name, seconds, calls=1):
+    with lock:
+        timer = timers.setdefault(name, [0, 0.0])
+        timer[0] += calls
+        timer[1] += seconds
+
+# time a block of code (with timed("phonemize"): …) or every call of a function (@timed("phonemize"))
+# (the decorator times the calls directly, without entering a context manager for each call, as it is also used for
+# functions that are called once per poem)
+class timed:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exception):
+        add_time(self.name, time.perf_counter() - self.start)
+
+    def __call__(self, function):
+        name = self.name
+
+        @wraps(function)
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                add_time(name, time.perf_counter() - start)
+        return timed_function
+
+def count(name, n=1):
+    with lock:
+        counters[name] = counters.get(name, 0) + n
+
+# add items processed in the given time to a throughput (e.g. poems of a condition)
+def add_throughput(name, items, seconds):
+    with lock:
+        throughput = throughputs.setdefault(name, [0, 0.0])
+        throughput[0] += items
+        throughput[1] += seconds
+
+def get_stats():
+    with lock:
+        return {"timers": {name: list(timers[name]) for name in timers}, "counters": dict(counters),
+                "throughputs": {name: list(throughputs[name]) for name in throughputs}}
+
+def reset():
+    with lock:
+        timers.clear()
+        counters.clear()
+        throughputs.clear()
+
+# get the statistics collected since the last call and reset them (e.g. in a worker process after each task)
+def take_stats():
+    with lock:
+        stats = get_stats()
+        reset()
+    return stats
+
+# add statistics of another process (from take_stats) to those of this process
+def merge_stats(stats):
+    for name in stats["timers"]:
+        add_time(name, stats["timers"][name][1], calls=stats["timers"][name][0])
+    for name in stats["counters"]:
+        count(name, stats["counters"][name])
+    for name in stats["throughputs"]:
+        add_throughput(name, *stats["throughputs"][name])
+
+# get the report of the collected statistics (with further entries, e.g. the total time of the run, from extra)
+# (the times of worker processes are added up, so a stage can take longer in total than the whole run)
+def get_report(**extra):
+    stats = get_stats()
+    report = dict(extra)
+    report["timers"] = {name: {"calls": calls, "seconds": seconds, "mean_seconds": seconds / calls if calls > 0 else 0}
+                        for name, (calls, seconds) in sorted(stats["timers"].items())}
+    report["counters"] = dict(sorted(stats["counters"].items()))
+    report["cache_hit_rates"] = {}
+    for name in report["counters"]:
+        if name.endswith("_hits"):
+            cache = name[:-len("_hits")]
+            lookups = report["counters"][name] + report["counters"].get(cache + "_misses", 0)
+            report["cache_hit_rates"][cache] = report["counters"][name] / lookups if lookups > 0 else None
+    report["throughputs"] = {name: {"items": items, "seconds": seconds,
+                                    "items_per_second": items / seconds if seconds > 0 else None}
+                             for name, (items, seconds) in sorted(stats["throughputs"].items())}
+    return report
+
+def write_report(path, **extra):
+    with open(path, "w") as outfile:
+        json.dump(get_report(**extra), outfile, indent=2)
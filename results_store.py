@@ -0,0 +1,74 @@
+import os
+import csv
+import sqlite3
+from profiling import timed
+
+# names of the metrics in the results store
+METRICS = ["cometkiwi", "metrical_distance", "rhyme_scheme_similarity"]
+
+# store of evaluation results in an SQLite database
+# for each (condition, poem, metric), the value is stored together with the version of the metric and a hash of its
+# inputs, so that a result only has to be recomputed if the inputs or the code of the metric have changed
+class ResultsStore:
+    def __init__(self, path="results.sqlite"):
+        self.path = path
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results (condition TEXT NOT NULL, poem INTEGER NOT NULL, "
+                                "metric TEXT NOT NULL, version TEXT NOT NULL, input_hash TEXT NOT NULL, value REAL, "
+                                "PRIMARY KEY (condition, poem, metric))")
+        self.connection.commit()
+
+    # get the (version, input hash) of all stored results of the given conditions,
+    # as a dictionary with (condition, poem, metric) as keys
+    def get_entries(self, conditions):
+        entries = {}
+        for condition in conditions:
+            for poem, metric, version, input_hash in self.connection.execute(
+                    "SELECT poem, metric, version, input_hash FROM results WHERE condition = ?", (condition,)):
+                entries[(condition, poem, metric)] = (version, input_hash)
+        return entries
+
+    # store results, given as (condition, poem, metric, version, input hash, value)
+    # (replace=False only adds results for (condition, poem, metric) that are not in the store yet)
+    @timed("results_store_put")
+    def put(self, results, replace=True):
+        self.connection.executemany(f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO results "
+                                    f"(condition, poem, metric, version, input_hash, value) VALUES (?, ?, ?, ?, ?, ?)",
+                                    results)
+        self.connection.commit()
+
+    # get the results as rows (condition, poem, cometkiwi, metrical distance, rhyme scheme similarity),
+    # with None for metrics that are undefined or have not been computed
+    def get_rows(self, conditions=None):
+        rows = {}
+        for condition, poem, metric, value in self.connection.execute(
+                "SELECT condition, poem, metric, value FROM results ORDER BY condition, poem"):
+            if conditions is None or condition in conditions:
+                rows.setdefault((condition, poem), [None] * len(METRICS))[METRICS.index(metric)] = value
+        if conditions is not None:
+            keys = sorted(rows, key=lambda k: (conditions.index(k[0]), k[1]))
+        else:
+            keys = list(rows)
+        return [(k[0], k[1], *rows[k]) for k in keys]
+
+    # add the results from a csv file (in the format of results.csv) that are not in the store yet
+    def import_csv(self, path):
+        results = []
+        for l in csv.reader(open(path, "r")):
+            if len(l) < 5 or 'translator' in l: # skip the header
+                continue
+            for m in range(len(METRICS)):
+                value = None if l[m + 2] == "None" else float(l[m + 2])
+                results.append((l[0], int(l[1]), METRICS[m], "csv", "", value))
+        self.put(results, replace=False)
+
+    # write the results to a csv file (in the format of results.csv)
+    def export_csv(self, path, conditions=None):
+        with open(path, "w") as results:
+            for row in self.get_rows(conditions):
+                results.write(",".join(str(x) for x in row) + "\n")
+
+    def close(self):
+        self.connection.close()
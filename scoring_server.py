@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+from corpus import ORIGINALS, REFERENCE_METRES, REFERENCE_RHYME_SCHEMES
+from corpus import read_metres, read_poems, read_rhyme_schemes
+from metrics import CometKiwiScorer
+from metrics import get_metrical_distance_batch
+from metrics import get_rhyme_scheme_similarity
+from phonemes import get_backend, phonemize_poems
+from profiling import get_report, timed
+
+# local scoring service that keeps the CometKiwi model and the espeak backends loaded, so that single poems (e.g. the
+# output of a prompt variant in get_translations.py) can be scored in milliseconds instead of loading everything again
+# usage: python scoring_server.py --port 8765 --checkpoint path/to/checkpoint.ckpt
+# endpoints (POST, JSON, each for a batch of translations):
+# - /metrical_distance: {"translations": […], "poems": [numbers of the sonnets]} or {…, "metres": [metre, …]}
+# - /rhyme_scheme_similarity: {"translations": […], "poems": […]} or {…, "rhyme_schemes": [rhyme scheme, …]}
+# - /cometkiwi: {"translations": […], "poems": […]} or {…, "originals": [original, …]}
+# each returns {"scores": [score of each translation]}; GET /health returns the timers and counters of the service
+# (an optional "lang" in the request sets the language of the translations for metre and rhyme)
+
+default_url = "http://127.0.0.1:8765"
+
+# collects the items submitted by concurrent requests and processes them together, in batches of up to
+# max_batch_size items (waiting at most max_wait seconds for further items after the first one of a batch)
+# function gets a list of items and returns a list of results; all batches are processed on one thread
+# (if function fails for a batch, its items are processed again one by one)
+class MicroBatcher:
+    def __init__(self, function, max_batch_size=64, max_wait=0.01):
+        self.function = function
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # process a list of items (together with those of other requests) and return their results
+    def submit(self, items):
+        futures = []
+        for item in items:
+            future = Future()
+            self.queue.put((item, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                results = self.function([item for item, future in batch])
+                for n in range(len(batch)):
+                    batch[n][1].set_result(results[n])
+            except Exception:
+                # process the items one at a time, so that only the requests with the failing items fail
+                for item, future in batch:
+                    if future.done():
+                        continue
+                    try:
+                        future.set_result(self.function([item])[0])
+                    except Exception as e:
+                        future.set_exception(e)
+
+# the originals and references (from the data directory), the scorer and the batchers of the service
+originals = None
+metres = None
+rhyme_schemes = None
+scorer = None
+form_batcher = None
+cometkiwi_batcher = None
+default_lang = "de"
+
+# compute metrical distances and rhyme scheme similarities for items (metric, translation, reference, lang), with one
+# phonemizer call per language for all translations
+def score_form(items):
+    results = [None] * len(items)
+    for lang in set(item[3] for item in items):
+        indices = [n for n in range(len(items)) if items[n][3] == lang]
+        with timed("service_phonemize"):
+            transcriptions = dict(zip(indices, phonemize_poems([items[n][1] for n in indices], lang=lang)))
+        metre_indices = [n for n in indices if items[n][0] == "metrical_distance"]
+        distances = get_metrical_distance_batch([items[n][1] for n in metre_indices],
+                                                [items[n][2] for n in metre_indices], lang=lang,
+                                                transcriptions=[transcriptions[n] for n in metre_indices])
+        for n, distance in zip(metre_indices, distances):
+            results[n] = distance
+        for n in indices:
+            if items[n][0] == "rhyme_scheme_similarity":
+                results[n] = get_rhyme_scheme_similarity(items[n][1], items[n][2], lang=lang,
+                                                         transcriptions=transcriptions[n])[2]
+    return results
+
+# compute CometKiwi scores for items (original, translation), in one call of the scorer
+def score_cometkiwi(items):
+    return scorer.score([item[0] for item in items], [item[1] for item in items])
+
+# get the references of a request: given explicitly (request[key]) or by the numbers of the poems (request["poems"])
+def get_references(request, key, references):
+    if key in request:
+        values = request[key]
+    else:
+        if any(number < 1 or number > len(references) for number in request["poems"]):
+            raise IndexError(f"poem numbers must be between 1 and {len(references)}")
+        values = [references[number - 1] for number in request["poems"]]
+    if len(values) != len(request["translations"]):
+        raise ValueError(f"{len(request['translations'])} translations, but {len(values)} {key}")
+    return values
+
+def handle_metrical_distance(request):
+    lang = request.get("lang", default_lang)
+    references = get_references(request, "metres", metres)
+    return {"scores": form_batcher.submit([("metrical_distance", translation, metre, lang)
+                                           for translation, metre in zip(request["translations"], references)])}
+
+def handle_rhyme_scheme_similarity(request):
+    lang = request.get("lang", default_lang)
+    references = get_references(request, "rhyme_schemes", rhyme_schemes)
+    return {"scores": form_batcher.submit([("rhyme_scheme_similarity", translation, rhyme_scheme, lang)
+                                           for translation, rhyme_scheme in zip(request["translations"],
+                                                                                references)])}
+
+def handle_cometkiwi(request):
+    if cometkiwi_batcher is None:
+        raise ValueError("CometKiwi is not available (the service was started with --no-cometkiwi)")
+    references = get_references(request, "originals", originals)
+    return {"scores": cometkiwi_batcher.submit(list(zip(references, request["translations"])))}
+
+ENDPOINTS = {"metrical_distance": handle_metrical_distance,
+             "rhyme_scheme_similarity": handle_rhyme_scheme_similarity,
+             "cometkiwi": handle_cometkiwi}
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    def send_json(self, status, response):
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.strip("/") != "health":
+            self.send_json(404, {"error": f"unknown endpoint {self.path}"})
+            return
+        self.send_json(200, {"status": "ok", "cometkiwi": cometkiwi_batcher is not None, "report": get_report()})
+
+    def do_POST(self):
+        endpoint = self.path.strip("/")
+        if endpoint not in ENDPOINTS:
+            self.send_json(404, {"error": f"unknown endpoint {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            with timed(f"service_{endpoint}"):
+                response = ENDPOINTS[endpoint](request)
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            self.send_json(400, {"error": f"{type(e).__name__}: {e}"})
+            return
+        except Exception as e:
+            # e.g. an error of espeak or of the CometKiwi model
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self.send_json(200, response)
+
+    def log_message(self, format, *args):
+        pass
+
+# HTTP server with one thread per request (and a longer queue of pending connections than the default of 5, for
+# many concurrent clients)
+class ScoringServer(ThreadingHTTPServer):
+    request_queue_size = 128
+    daemon_threads = True
+
+# load the references and warm up the espeak backend and the CometKiwi model (unless scorer is None), then start
+# the batchers; returns the HTTP server (call serve_forever to handle requests)
+def start(data_dir="data", host="127.0.0.1", port=8765, lang="de", cometkiwi_scorer=None, max_batch_size=64,
+          max_wait=0.01):
+    global originals, metres, rhyme_schemes, scorer, form_batcher, cometkiwi_batcher, default_lang
+    originals = read_poems(os.path.join(data_dir, ORIGINALS))
+    metres = read_metres(os.path.join(data_dir, REFERENCE_METRES))
+    rhyme_schemes = read_rhyme_schemes(os.path.join(data_dir, REFERENCE_RHYME_SCHEMES))
+    default_lang = lang
+    get_backend(lang)
+    form_batcher = MicroBatcher(score_form, max_batch_size=max_batch_size, max_wait=max_wait)
+    scorer = cometkiwi_scorer
+    if scorer is not None:
+        scorer.load()
+        cometkiwi_batcher = MicroBatcher(score_cometkiwi, max_batch_size=max_batch_size, max_wait=max_wait)
+    return ScoringServer((host, port), ScoringHandler)
+
+# send a request to a running scoring service, e.g.
+# request_scores("metrical_distance", {"translations": [translation], "poems": [18]})["scores"][0]
+def request_scores(endpoint, request, url=default_url, timeout=600):
+    http_request = Request(f"{url}/{endpoint}", data=json.dumps(request).encode("utf-8"),
+                           headers={"Content-Type": "application/json"})
+    with urlopen(http_request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve metrical distance, rhyme scheme similarity and CometKiwi "
+                                                 "with the models kept loaded.")
+    parser.add_argument("--data", default="data", help="directory with the originals and references")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on")
+    parser.add_argument("--lang", default="de", help="default language of the translations")
+    parser.add_argument("--max-batch-size", type=int, default=64,
+                        help="maximum number of poems scored together (across concurrent requests)")
+    parser.add_argument("--max-wait", type=float, default=0.01,
+                        help="seconds to wait for further requests before scoring a batch")
+    parser.add_argument("--no-cometkiwi", action="store_true", help="only serve metre and rhyme")
+    parser.add_argument("--checkpoint", default=None,
+                        help="path to a local CometKiwi checkpoint (for machines without network access)")
+    parser.add_argument("--batch-size", type=int, default=16, help="batch size for CometKiwi")
+    parser.add_argument("--gpus", type=int, default=1, help="number of GPUs for CometKiwi (0 for the CPU)")
+    parser.add_argument("--comet-workers", type=int, default=None, help="number of data loader workers for CometKiwi")
+    args = parser.parse_args()
+
+    cometkiwi_scorer = None
+    if not args.no_cometkiwi:
+        cometkiwi_scorer = CometKiwiScorer(checkpoint_path=args.checkpoint, batch_size=args.batch_size,
+                                           gpus=args.gpus, num_workers=args.comet_workers)
+    server = start(data_dir=args.data, host=args.host, port=args.port, lang=args.lang,
+                   cometkiwi_scorer=cometkiwi_scorer, max_batch_size=args.max_batch_size, max_wait=args.max_wait)
+    print(f"scoring service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
@@ -0,0 +1,32 @@
+import os
+import pytest
+from benchmark import Corpus, golden_dir, get_golden_path, load_golden
+from phonemes import get_backend
+
+# fixtures of the benchmarks: the corpus (whose transcriptions are only computed when a benchmark needs them), the
+# golden file of the condition the benchmarks of a single condition use and results.csv
+# run with: python -m pytest (pytest-benchmark reports the timings; --benchmark-disable only checks the results)
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONDITION = "gpt4o_plain"
+
+@pytest.fixture(scope="session")
+def corpus():
+    return Corpus(os.path.join(root, "data"), golden_dir=os.path.join(root, golden_dir))
+
+@pytest.fixture(scope="session")
+def results_path():
+    return os.path.join(root, "results.csv")
+
+@pytest.fixture(scope="session")
+def golden():
+    return load_golden(get_golden_path(os.path.join(root, golden_dir), CONDITION))
+
+# skip the benchmarks that phonemize (all conditions, the originals) if espeak is not installed
+@pytest.fixture(scope="session")
+def espeak():
+    try:
+        get_backend("de")
+        get_backend("en")
+    except RuntimeError as e:
+        pytest.skip(f"espeak is not available ({e})")
@@ -0,0 +1,58 @@
+import pytest
+from benchmark import TinyCometModel, check_results_csv, current_scores, get_tiny_comet_score, get_translations_key, \
+    read_results_csv, reference_scores
+from evaluate_translations import evaluate_form
+from metrics import CometKiwiScorer
+from conftest import CONDITION
+
+@pytest.fixture(scope="module")
+def condition(corpus):
+    return (CONDITION, corpus.translations[CONDITION], corpus.get_transcriptions(CONDITION), corpus.metres,
+            corpus.rhyme_schemes)
+
+def test_golden_file(corpus, golden):
+    assert golden["tag"] == CONDITION
+    assert golden["translations"] == get_translations_key(corpus.translations[CONDITION])
+
+@pytest.mark.benchmark(group="condition")
+def test_reference_scores(benchmark, condition, golden, results_path):
+    scores = benchmark.pedantic(reference_scores, args=condition[1:], rounds=1, iterations=1)
+    check_results_csv(results_path, golden, scores)
+
+@pytest.mark.benchmark(group="condition")
+def test_current_scores(benchmark, condition, golden, results_path):
+    check_results_csv(results_path, golden, benchmark(current_scores, *condition))
+
+def test_check_results_csv_fails_on_changed_values(golden, results_path):
+    scores = read_results_csv(results_path, CONDITION)
+    known = golden["metrical_distance_mismatches"]
+    matching = [i for i in range(1, len(scores) + 1) if i not in known][0]
+    # a different metrical distance of the known mismatches passes, a different rhyme scheme similarity does not
+    changed = [(score[0] + 1, score[1]) if i + 1 in known else score for i, score in enumerate(scores)]
+    check_results_csv(results_path, golden, changed)
+    changed[3] = (changed[3][0], changed[3][1] + 1e-9)
+    with pytest.raises(AssertionError, match="rhyme scheme similarity .* \\[4\\]"):
+        check_results_csv(results_path, golden, changed)
+    # as does a different metrical distance of a poem that matches results.csv
+    changed = [(score[0] + 1, score[1]) if i + 1 in known + [matching] else score for i, score in enumerate(scores)]
+    with pytest.raises(AssertionError, match=f"metrical distance .* \\[{matching}\\]"):
+        check_results_csv(results_path, golden, changed)
+
+# with the transcriptions of the installed espeak version, which are only those of the golden file if it was written
+# with the same version
+@pytest.mark.benchmark(group="condition")
+def test_evaluate_form(benchmark, corpus, condition, espeak):
+    tag, translations, transcriptions, metres, rhyme_schemes = condition
+    units = [(tag, i, translations[i], metres[i], rhyme_schemes[i], "de", "", "") for i in range(len(translations))]
+    values = {(r[1], r[2]): r[5] for r in benchmark.pedantic(evaluate_form, args=(units,), rounds=1, iterations=1)}
+    scores = [(values[(i + 1, "metrical_distance")], values[(i + 1, "rhyme_scheme_similarity")])
+              for i in range(len(translations))]
+    assert scores == current_scores(tag, translations, transcriptions, metres, rhyme_schemes)
+
+@pytest.mark.benchmark(group="cometkiwi")
+def test_cometkiwi_scorer(benchmark, corpus):
+    scorer = CometKiwiScorer(cache_path=None)
+    scorer.model = TinyCometModel()
+    translations = corpus.translations[CONDITION]
+    assert benchmark(scorer.score, corpus.originals, translations) == \
+        [get_tiny_comet_score(corpus.originals[i], translations[i]) for i in range(len(translations))]
@@ -0,0 +1,12 @@
+import os
+import pytest
+from corpus import REFERENCE_METRES, REFERENCE_RHYME_SCHEMES
+from corpus import parse_metres, parse_rhyme_schemes, read_metres, read_rhyme_schemes
+
+@pytest.mark.parametrize("name,parse,read", [(REFERENCE_METRES, parse_metres, read_metres),
+                                             (REFERENCE_RHYME_SCHEMES, parse_rhyme_schemes, read_rhyme_schemes)])
+@pytest.mark.benchmark(group="corpus")
+def test_read_compiled(benchmark, corpus, name, parse, read):
+    path = os.path.join(corpus.data_dir, name)
+    read(path) # compile the file (if it has not been compiled yet)
+    assert benchmark(read, path).to_lists() == parse(path)
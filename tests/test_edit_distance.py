@@ -0,0 +1,57 @@
+import pytest
+from benchmark import get_long_pairs, get_metrical_variants, reference_edit_distance_alignment, \
+    reference_metrical_distance
+from metrics import edit_distance, edit_distance_alignment, edit_distance_batch, get_metrical_distance, \
+    get_metrical_distance_batch
+from conftest import CONDITION
+
+@pytest.fixture(scope="module")
+def pairs(corpus):
+    return corpus.get_pairs([CONDITION])
+
+@pytest.fixture(scope="module")
+def reference(pairs):
+    return [reference_edit_distance_alignment(line, metre) for line, metre in pairs]
+
+@pytest.mark.benchmark(group="edit_distance")
+def test_reference_edit_distance_alignment(benchmark, pairs, reference):
+    assert benchmark.pedantic(lambda: [reference_edit_distance_alignment(line, metre) for line, metre in pairs],
+                              rounds=1, iterations=1) == reference
+
+@pytest.mark.benchmark(group="edit_distance")
+def test_edit_distance_alignment(benchmark, pairs, reference):
+    assert benchmark(lambda: [edit_distance_alignment(line, metre) for line, metre in pairs]) == reference
+
+@pytest.mark.benchmark(group="edit_distance")
+def test_edit_distance(benchmark, pairs, reference):
+    assert benchmark(lambda: [edit_distance(line, metre) for line, metre in pairs]) == [r[1] for r in reference]
+
+@pytest.mark.benchmark(group="edit_distance")
+def test_edit_distance_batch(benchmark, pairs, reference):
+    lines = [line for line, metre in pairs]
+    metres = [metre for line, metre in pairs]
+    assert benchmark(edit_distance_batch, lines, metres) == [r[1] for r in reference]
+
+@pytest.mark.parametrize("length", [10, 30])
+@pytest.mark.benchmark(group="long_lines")
+def test_edit_distance_long_lines(benchmark, pairs, length):
+    long_pairs = get_long_pairs(pairs, length)
+    reference = [reference_edit_distance_alignment(line, metre) for line, metre in long_pairs]
+    assert benchmark(lambda: [edit_distance_alignment(line, metre) for line, metre in long_pairs]) == reference
+    assert edit_distance_batch([line for line, metre in long_pairs], [metre for line, metre in long_pairs]) == \
+        [r[1] for r in reference]
+
+@pytest.fixture(scope="module")
+def variants(corpus):
+    candidates, metres = get_metrical_variants(corpus.get_stresses(CONDITION), corpus.metres)
+    return candidates, metres, [reference_metrical_distance(c, m) for c, m in zip(candidates, metres)]
+
+@pytest.mark.benchmark(group="metrical_distance")
+def test_get_metrical_distance(benchmark, variants):
+    candidates, metres, reference = variants
+    assert benchmark(lambda: [get_metrical_distance(c, m) for c, m in zip(candidates, metres)]) == reference
+
+@pytest.mark.benchmark(group="metrical_distance")
+def test_get_metrical_distance_batch(benchmark, variants):
+    candidates, metres, reference = variants
+    assert benchmark(get_metrical_distance_batch, candidates, metres) == reference
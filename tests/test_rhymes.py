@@ -0,0 +1,55 @@
+import pytest
+from benchmark import get_long_poems, reference_rhyme, reference_rhyme_pairs, reference_rhyme_scheme_similarity, \
+    reference_stresses
+from metrics import get_rhyme_batch, get_rhyme_pairs, get_rhyme_scheme_similarity, get_stresses_batch
+from conftest import CONDITION
+
+@pytest.fixture(scope="module")
+def transcriptions(corpus):
+    return [transcription for poem in corpus.get_transcriptions(CONDITION) for transcription in poem]
+
+@pytest.mark.benchmark(group="stresses")
+def test_get_stresses_batch(benchmark, transcriptions):
+    reference = [reference_stresses(transcription, lang="de") for transcription in transcriptions]
+    assert benchmark(get_stresses_batch, transcriptions, lang="de") == reference
+
+@pytest.mark.benchmark(group="rhymes")
+def test_get_rhyme_batch(benchmark, transcriptions):
+    reference = [reference_rhyme(transcription, lang="de") for transcription in transcriptions]
+    assert benchmark(get_rhyme_batch, transcriptions, lang="de") == reference
+
+# the English originals have to be phonemized
+@pytest.mark.benchmark(group="stresses")
+def test_get_stresses_batch_english(benchmark, corpus, espeak):
+    transcriptions = [transcription for poem in corpus.get_original_transcriptions() for transcription in poem]
+    reference = [reference_stresses(transcription, lang="en") for transcription in transcriptions]
+    assert benchmark(get_stresses_batch, transcriptions, lang="en") == reference
+
+@pytest.mark.benchmark(group="rhymes")
+def test_get_rhyme_batch_english(benchmark, corpus, espeak):
+    transcriptions = [transcription for poem in corpus.get_original_transcriptions() for transcription in poem]
+    reference = [reference_rhyme(transcription, lang="en") for transcription in transcriptions]
+    assert benchmark(get_rhyme_batch, transcriptions, lang="en") == reference
+
+@pytest.mark.parametrize("length", [14, 140, 1000])
+@pytest.mark.benchmark(group="rhyme_pairs")
+def test_get_rhyme_pairs(benchmark, corpus, length):
+    poems = get_long_poems(corpus.get_all_rhymes([CONDITION]), length, total=3000)
+    reference = [reference_rhyme_pairs(poem) for poem in poems]
+    assert benchmark(lambda: [get_rhyme_pairs(poem) for poem in poems]) == reference
+
+@pytest.mark.benchmark(group="rhyme_scheme_similarity")
+def test_get_rhyme_scheme_similarity(benchmark, corpus):
+    poems = list(zip(corpus.get_rhymes(CONDITION), corpus.rhyme_schemes))
+    reference = [reference_rhyme_scheme_similarity(rhymes, rhyme_scheme) for rhymes, rhyme_scheme in poems]
+    assert benchmark(lambda: [get_rhyme_scheme_similarity(rhymes, rhyme_scheme)
+                              for rhymes, rhyme_scheme in poems]) == reference
+
+# all conditions, which have to be phonemized
+@pytest.mark.benchmark(group="rhyme_scheme_similarity")
+def test_get_rhyme_scheme_similarity_all_conditions(benchmark, corpus, espeak):
+    poems = [(corpus.get_rhymes(tag)[i], corpus.rhyme_schemes[i]) for tag in corpus.tags
+             for i in range(len(corpus.rhyme_schemes))]
+    reference = [reference_rhyme_scheme_similarity(rhymes, rhyme_scheme) for rhymes, rhyme_scheme in poems]
+    assert benchmark(lambda: [get_rhyme_scheme_similarity(rhymes, rhyme_scheme)
+                              for rhymes, rhyme_scheme in poems]) == reference
@@ -1,17 +1,16 @@
 import matplotlib.pyplot as plt
 import random
-import csv
-from scipy.stats import bootstrap
-import numpy as np
+from aggregate import get_aggregates
+from results_store import ResultsStore
 
 plt.rcParams.update({'axes.labelsize': 15})
 plt.rcParams.update({'xtick.labelsize': 15})
 plt.rcParams.update({'ytick.labelsize': 15})
 
-def get_mean(v, x):
-    return np.mean(v)
-
-filenames = ["results.csv"] # names of files containing the results
+store_path = "results.sqlite" # results store written by evaluate_translations.py
+# names of csv files containing further results (e.g. those of the paper), which are added to the store
+# (except for results of conditions and poems that are already in the store)
+filenames = ["results.csv"]
 
 # the tags of the relevant conditions in the result files
 tags = ["deepl","george","tieck","regis","wolff","walesrode","gpt4o_plain","gpt4o_plainform","gpt4o_plainmeaning","gemini_plain","gemini_plainform","gemini_plainmeaning","claude_plain","claude_plainform","claude_plainmeaning","o4mini_plain","o4mini_plainform","o4mini_plainmeaning","gpt5_plain","gpt5_plainform","gpt5_plainmeaning"]
@@ -37,12 +36,17 @@ labels = ["DeepL", "Human", None, None, None, None, "GPT-4o: Plain", "   PlainFo
 
 type = "average_values" # "average_values" or "points", depending on whether averages or individual poems shall be visualized
 plot_besides = True # plot metre and rhyme next to each other
+n_resamples = 9999 # number of bootstrap resamples for the confidence intervals
+seed = 0 # seed of the bootstrap resamples (the aggregates are cached, so re-plotting the same results is instant)
 
-results = []
+store = ResultsStore(store_path)
 for fn in filenames:
-    for l in csv.reader(open(f"{fn}","r")):
-        if 'None' not in l and 'translator' not in l: # unless one of the metrics is undefined or the line is the header
-            results.append([l[0], int(l[1]), float(l[2]), float(l[3]), float(l[4])])
+    store.import_csv(fn)
+results = []
+for l in store.get_rows(tags):
+    if None not in l: # unless one of the metrics is undefined
+        results.append([l[0], int(l[1]), float(l[2]), float(l[3]), float(l[4])])
+store.close()
 # convert to dictionary
 data = {} # dictionary with lists of triples as values: key: tag, value: [(Bert score, metre, rhyme)]
 for tag in tags:
@@ -56,22 +60,18 @@ if plot_besides:
     plt.subplot(1, 2, 1)
 
 if type == "average_values":
-    # get average values and bootstrap confidence intervals
-    means_cometkiwi = [np.mean([r[0] for r in data[c]]) for c in tags]
-    means_metre = [np.mean([r[1] for r in data[c]]) for c in tags]
-    means_rhyme = [np.mean([r[2] for r in data[c]]) for c in tags]
-    boot_cometkiwi = [bootstrap(([r[0] for r in data[c]], [0 for r in data[c]]), get_mean, method="basic") for c in tags]
-    boot_metre = [bootstrap(([r[1] for r in data[c]], [0 for r in data[c]]), get_mean, method="basic") for c in tags]
-    boot_rhyme = [bootstrap(([r[2] for r in data[c]], [0 for r in data[c]]), get_mean, method="basic") for c in tags]
+    # get average values and bootstrap confidence intervals (for all conditions and metrics at once, see aggregate.py)
+    aggregates = get_aggregates(data, tags, n_resamples=n_resamples, seed=seed)
 
     plt.gca().invert_xaxis()
 
     # visualize metrical distance
     for i in range(len(tags)):
-        metre_mean = np.mean(boot_metre[i].bootstrap_distribution)
-        cometkiwi_mean = np.mean(boot_cometkiwi[i].bootstrap_distribution)
-        xerr = [[metre_mean - boot_metre[i].confidence_interval[0]], [boot_metre[i].confidence_interval[1] - metre_mean]]
-        yerr = [[cometkiwi_mean - boot_cometkiwi[i].confidence_interval[0]], [boot_cometkiwi[i].confidence_interval[1] - cometkiwi_mean]]
+        aggregate = aggregates[tags[i]]
+        metre_mean = aggregate["bootstrap_mean"][1]
+        cometkiwi_mean = aggregate["bootstrap_mean"][0]
+        xerr = [[metre_mean - aggregate["low"][1]], [aggregate["high"][1] - metre_mean]]
+        yerr = [[cometkiwi_mean - aggregate["low"][0]], [aggregate["high"][0] - cometkiwi_mean]]
         plt.errorbar(metre_mean, cometkiwi_mean, xerr=xerr, yerr=yerr, fmt=markers[i], color=colors[i], label=labels[i], markersize=markersizes[i])
         plt.ylabel("CometKiwi", fontsize=24)
         plt.xlabel("Metrical distance", fontsize=24)
@@ -83,10 +83,11 @@ if type == "average_values":
 
     # visualize rhyme scheme similarities
     for i in range(len(tags)):
-        rhyme_mean = np.mean(boot_rhyme[i].bootstrap_distribution)
-        cometkiwi_mean = np.mean(boot_cometkiwi[i].bootstrap_distribution)
-        xerr = [[rhyme_mean - boot_rhyme[i].confidence_interval[0]], [boot_rhyme[i].confidence_interval[1] - rhyme_mean]]
-        yerr = [[cometkiwi_mean - boot_cometkiwi[i].confidence_interval[0]], [boot_cometkiwi[i].confidence_interval[1] - cometkiwi_mean]]
+        aggregate = aggregates[tags[i]]
+        rhyme_mean = aggregate["bootstrap_mean"][2]
+        cometkiwi_mean = aggregate["bootstrap_mean"][0]
+        xerr = [[rhyme_mean - aggregate["low"][2]], [aggregate["high"][2] - rhyme_mean]]
+        yerr = [[cometkiwi_mean - aggregate["low"][0]], [aggregate["high"][0] - cometkiwi_mean]]
         plt.errorbar(rhyme_mean, cometkiwi_mean, xerr=xerr, yerr=yerr, fmt=markers[i], color=colors[i], label=labels[i], markersize=markersizes[i])
         plt.ylabel("CometKiwi", fontsize=24)
         plt.xlabel("Rhyme scheme similarity", fontsize=24)